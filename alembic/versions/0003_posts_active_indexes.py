@@ -0,0 +1,41 @@
+"""partial indexes for active posts listing
+
+Revision ID: 0003_posts_active_indexes
+Revises: 0002_post_attachments
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_posts_active_indexes"
+down_revision = "0002_post_attachments"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_posts_is_deleted", table_name="posts")
+    op.create_index(
+        "ix_posts_active_recent",
+        "posts",
+        [sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text("is_deleted = false"),
+    )
+    op.create_index(
+        "ix_posts_topic_active",
+        "posts",
+        ["topic_id", sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text("is_deleted = false"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_posts_topic_active", table_name="posts")
+    op.drop_index("ix_posts_active_recent", table_name="posts")
+    op.create_index("ix_posts_is_deleted", "posts", ["is_deleted"], unique=False)
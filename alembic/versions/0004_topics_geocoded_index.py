@@ -0,0 +1,31 @@
+"""partial index for geocoded topics
+
+Revision ID: 0004_topics_geocoded_index
+Revises: 0003_posts_active_indexes
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_topics_geocoded_index"
+down_revision = "0003_posts_active_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_topics_geocoded_lat_lon", table_name="topics")
+    op.create_index(
+        "ix_topics_geocoded",
+        "topics",
+        ["geocoded_lat", "geocoded_lon", "geocode_confidence"],
+        unique=False,
+        postgresql_where=sa.text("geocoded_lat IS NOT NULL AND geocoded_lon IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_topics_geocoded", table_name="topics")
+    op.create_index("ix_topics_geocoded_lat_lon", "topics", ["geocoded_lat", "geocoded_lon"], unique=False)
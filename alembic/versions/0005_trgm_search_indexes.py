@@ -0,0 +1,39 @@
+"""trigram indexes for substring search
+
+Revision ID: 0005_trgm_search_indexes
+Revises: 0004_topics_geocoded_index
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+
+
+revision = "0005_trgm_search_indexes"
+down_revision = "0004_topics_geocoded_index"
+branch_labels = None
+depends_on = None
+
+TRGM_INDEXES = (
+    ("ix_posts_content_trgm", "posts", "content_text"),
+    ("ix_posts_author_trgm", "posts", "author"),
+    ("ix_topics_title_trgm", "topics", "title"),
+    ("ix_topics_place_name_trgm", "topics", "place_name"),
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRGM_INDEXES:
+        op.create_index(
+            name,
+            table,
+            [column],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(TRGM_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,57 @@
+"""use posts.deleted_at as the only soft-delete flag
+
+Revision ID: 0006_posts_drop_is_deleted
+Revises: 0005_trgm_search_indexes
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_posts_drop_is_deleted"
+down_revision = "0005_trgm_search_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _create_active_indexes(predicate: str) -> None:
+    op.create_index(
+        "ix_posts_active_recent",
+        "posts",
+        [sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text(predicate),
+    )
+    op.create_index(
+        "ix_posts_topic_active",
+        "posts",
+        ["topic_id", sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text(predicate),
+    )
+
+
+def _drop_active_indexes() -> None:
+    op.drop_index("ix_posts_topic_active", table_name="posts")
+    op.drop_index("ix_posts_active_recent", table_name="posts")
+
+
+def upgrade() -> None:
+    op.execute("UPDATE posts SET deleted_at = COALESCE(deleted_at, now()) WHERE is_deleted")
+    op.execute("UPDATE posts SET deleted_at = NULL WHERE NOT is_deleted AND deleted_at IS NOT NULL")
+    _drop_active_indexes()
+    op.drop_column("posts", "is_deleted")
+    _create_active_indexes("deleted_at IS NULL")
+
+
+def downgrade() -> None:
+    _drop_active_indexes()
+    op.add_column(
+        "posts",
+        sa.Column("is_deleted", sa.Boolean(), server_default=sa.text("false"), nullable=False),
+    )
+    op.execute("UPDATE posts SET is_deleted = true WHERE deleted_at IS NOT NULL")
+    _create_active_indexes("is_deleted = false")
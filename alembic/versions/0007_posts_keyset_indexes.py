@@ -0,0 +1,43 @@
+"""align posts listing indexes with keyset order
+
+Revision ID: 0007_posts_keyset_indexes
+Revises: 0006_posts_drop_is_deleted
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_posts_keyset_indexes"
+down_revision = "0006_posts_drop_is_deleted"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_posts_posted_at_utc", table_name="posts")
+    op.create_index("ix_posts_posted_at_id", "posts", ["posted_at_utc", "id"], unique=False)
+    op.drop_index("ix_posts_active_recent", table_name="posts")
+    op.create_index(
+        "ix_posts_active_recent",
+        "posts",
+        [sa.text("posted_at_utc DESC"), sa.text("id DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_posts_active_recent", table_name="posts")
+    op.create_index(
+        "ix_posts_active_recent",
+        "posts",
+        [sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.drop_index("ix_posts_posted_at_id", table_name="posts")
+    op.create_index("ix_posts_posted_at_utc", "posts", ["posted_at_utc"], unique=False)
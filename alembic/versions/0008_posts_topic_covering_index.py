@@ -0,0 +1,37 @@
+"""cover posts.id in the per-topic active index
+
+Revision ID: 0008_posts_topic_covering_index
+Revises: 0007_posts_keyset_indexes
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_posts_topic_covering_index"
+down_revision = "0007_posts_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _create_topic_active_index(include: list[str]) -> None:
+    op.create_index(
+        "ix_posts_topic_active",
+        "posts",
+        ["topic_id", sa.text("posted_at_utc DESC")],
+        unique=False,
+        postgresql_using="btree",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+        postgresql_include=include,
+    )
+
+
+def upgrade() -> None:
+    op.drop_index("ix_posts_topic_active", table_name="posts")
+    _create_topic_active_index(["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_posts_topic_active", table_name="posts")
+    _create_topic_active_index([])
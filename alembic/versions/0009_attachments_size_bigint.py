@@ -0,0 +1,35 @@
+"""widen post_attachments.size_bytes to bigint
+
+Revision ID: 0009_attachments_size_bigint
+Revises: 0008_posts_topic_covering_index
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_attachments_size_bigint"
+down_revision = "0008_posts_topic_covering_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        "post_attachments",
+        "size_bytes",
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        existing_nullable=True,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "post_attachments",
+        "size_bytes",
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        existing_nullable=True,
+    )
@@ -0,0 +1,32 @@
+"""geocode cache
+
+Revision ID: 0010_geocode_cache
+Revises: 0009_attachments_size_bigint
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_geocode_cache"
+down_revision = "0009_attachments_size_bigint"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "geocode_cache",
+        sa.Column("place_key", sa.String(length=1024), nullable=False),
+        sa.Column("provider", sa.String(length=32), nullable=False),
+        sa.Column("lat", sa.Float(), nullable=False),
+        sa.Column("lon", sa.Float(), nullable=False),
+        sa.Column("confidence", sa.Float(), nullable=False),
+        sa.Column("fetched_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("place_key", "provider"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("geocode_cache")
@@ -0,0 +1,38 @@
+"""topic map stats
+
+Revision ID: 0011_topic_map_stats
+Revises: 0010_geocode_cache
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_topic_map_stats"
+down_revision = "0010_geocode_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "topic_map_stats",
+        sa.Column("topic_id", sa.Integer(), nullable=False),
+        sa.Column("posts_24h", sa.Integer(), nullable=False),
+        sa.Column("posts_7d", sa.Integer(), nullable=False),
+        sa.Column("posts_30d", sa.Integer(), nullable=False),
+        sa.Column("posts_total", sa.Integer(), nullable=False),
+        sa.Column("last_post_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("refreshed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["topic_id"], ["topics.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("topic_id"),
+    )
+    op.create_index(
+        "ix_topic_map_stats_last_post_at", "topic_map_stats", [sa.text("last_post_at DESC")], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_topic_map_stats_last_post_at", table_name="topic_map_stats")
+    op.drop_table("topic_map_stats")
@@ -0,0 +1,29 @@
+"""trigram index for attachment file name search
+
+Revision ID: 0012_attachments_file_name_trgm
+Revises: 0011_topic_map_stats
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+
+
+revision = "0012_attachments_file_name_trgm"
+down_revision = "0011_topic_map_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_post_attachments_file_name_trgm",
+        "post_attachments",
+        ["file_name"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"file_name": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_post_attachments_file_name_trgm", table_name="post_attachments")
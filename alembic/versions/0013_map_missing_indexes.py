@@ -0,0 +1,37 @@
+"""partial indexes for map topic ordering and missing attachments
+
+Revision ID: 0013_map_missing_indexes
+Revises: 0012_attachments_file_name_trgm
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0013_map_missing_indexes"
+down_revision = "0012_attachments_file_name_trgm"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_topics_geocoded_last_seen",
+        "topics",
+        [sa.text("last_seen_at DESC")],
+        unique=False,
+        postgresql_where=sa.text("geocoded_lat IS NOT NULL AND geocoded_lon IS NOT NULL"),
+    )
+    op.create_index(
+        "ix_post_attachments_missing",
+        "post_attachments",
+        [sa.text("post_id DESC")],
+        unique=False,
+        postgresql_where=sa.text("local_rel_path IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_post_attachments_missing", table_name="post_attachments")
+    op.drop_index("ix_topics_geocoded_last_seen", table_name="topics")
@@ -1,11 +1,14 @@
+import base64
+from datetime import datetime
+from functools import lru_cache
 from urllib.parse import urlparse
 from urllib.parse import urlencode
 
 from fastapi import APIRouter, Depends, Form, Request
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
+from app.api.public import invalidate_public_caches
 from app.database import get_db
 from app.models import Post
 from app.security import SESSION_KEY, verify_admin_credentials
@@ -15,20 +18,30 @@ from app.services.repository import (
     list_posts,
     list_topics,
     restore_post,
+    restore_posts,
     soft_delete_post,
+    soft_delete_posts,
     update_topic_coordinates,
 )
-from app.services.sync_service import SyncService
+from app.services.sync_service import get_sync_service
+from app.templating import templates
 
 router = APIRouter(prefix="/admin", tags=["admin"])
-templates = Jinja2Templates(directory="app/templates")
-sync_service = SyncService()
+sync_service = get_sync_service()
 
 
 def _is_auth(request: Request) -> bool:
     return bool(request.session.get(SESSION_KEY))
 
 
+def _commit_public_change(db: Session) -> None:
+    db.commit()
+    # Public pages are cached per query; drop them so moderation shows up immediately.
+    # Map stats are left to the scheduler; until it runs again, maps use live queries.
+    invalidate_public_caches()
+
+
+@lru_cache(maxsize=1024)
 def _posts_base_url(topic_url: str) -> str:
     parsed_topic = urlparse(topic_url)
     if not parsed_topic.scheme or not parsed_topic.netloc:
@@ -49,7 +62,7 @@ def _posts_base_url(topic_url: str) -> str:
 
 
 def _original_post_url(post: Post) -> str:
-    if post.url and "/posts/" in urlparse(post.url).path:
+    if post.url and "/posts/" in post.url and "/posts/" in urlparse(post.url).path:
         return post.url
     if post.external_id and post.external_id.isdigit():
         base = _posts_base_url(post.topic.url)
@@ -60,6 +73,22 @@ def _original_post_url(post: Post) -> str:
     return post.topic.url
 
 
+def _encode_cursor(posted_at: datetime, row_id: int) -> str:
+    raw = f"{posted_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        posted_at, post_id = raw.rsplit("|", maxsplit=1)
+        return datetime.fromisoformat(posted_at), int(post_id)
+    except Exception:
+        return None
+
+
 @router.get("/login")
 def login_form(request: Request):
     return templates.TemplateResponse("admin_login.html", {"request": request, "error": ""})
@@ -89,21 +118,30 @@ def admin_posts(
     q: str | None = None,
     include_deleted: bool = True,
     limit: int = 200,
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
     if not _is_auth(request):
         return RedirectResponse(url="/admin/login", status_code=303)
+    page_size = max(1, min(limit, 500))
     posts = list_posts(
         db,
         since=None,
         has_geo=False,
         include_deleted=include_deleted,
         q=q,
-        limit=min(limit, 500),
+        limit=page_size,
         offset=0,
+        before=_decode_cursor(cursor),
     )
     for post in posts:
         post.original_url = _original_post_url(post)
+    next_url = ""
+    if len(posts) == page_size:
+        params = {"include_deleted": str(include_deleted).lower(), "limit": page_size, "cursor": _encode_cursor(posts[-1].posted_at_utc, posts[-1].id)}
+        if q:
+            params["q"] = q
+        next_url = f"/admin/posts?{urlencode(params)}"
     return templates.TemplateResponse(
         "admin_posts.html",
         {
@@ -111,6 +149,7 @@ def admin_posts(
             "posts": posts,
             "q": q or "",
             "include_deleted": include_deleted,
+            "next_url": next_url,
         },
     )
 
@@ -141,6 +180,7 @@ def admin_attachments(
     q: str | None = None,
     only_missing: bool = False,
     limit: int = 300,
+    cursor: str | None = None,
     batch_posts: int | None = None,
     batch_downloaded: int | None = None,
     batch_checked: int | None = None,
@@ -152,12 +192,27 @@ def admin_attachments(
 ):
     if not _is_auth(request):
         return RedirectResponse(url="/admin/login", status_code=303)
-    rows = list_attachments(db, q=q, only_missing=only_missing, limit=min(limit, 500), offset=0)
+    page_size = max(1, min(limit, 500))
+    rows = list_attachments(
+        db, q=q, only_missing=only_missing, limit=page_size, offset=0, before=_decode_cursor(cursor)
+    )
+    next_url = ""
+    if len(rows) == page_size:
+        last = rows[-1]
+        params = {
+            "only_missing": str(only_missing).lower(),
+            "limit": page_size,
+            "cursor": _encode_cursor(last.post.posted_at_utc, last.id),
+        }
+        if q:
+            params["q"] = q
+        next_url = f"/admin/attachments?{urlencode(params)}"
     return templates.TemplateResponse(
         "admin_attachments.html",
         {
             "request": request,
             "rows": rows,
+            "next_url": next_url,
             "q": q or "",
             "only_missing": only_missing,
             "batch_posts": batch_posts,
@@ -242,7 +297,7 @@ def update_topic_coords_handler(
         return RedirectResponse(url="/admin/topics?error=invalid_coords", status_code=303)
     conf = max(0.0, min(1.0, confidence))
     if update_topic_coordinates(db, topic_id, lat=lat, lon=lon, confidence=conf, provider="manual"):
-        db.commit()
+        _commit_public_change(db)
     return RedirectResponse(url="/admin/topics", status_code=303)
 
 
@@ -251,7 +306,7 @@ def delete_post(post_id: int, request: Request, db: Session = Depends(get_db)):
     if not _is_auth(request):
         return RedirectResponse(url="/admin/login", status_code=303)
     if soft_delete_post(db, post_id):
-        db.commit()
+        _commit_public_change(db)
     return RedirectResponse(url="/admin/posts", status_code=303)
 
 
@@ -260,5 +315,23 @@ def restore_post_handler(post_id: int, request: Request, db: Session = Depends(g
     if not _is_auth(request):
         return RedirectResponse(url="/admin/login", status_code=303)
     if restore_post(db, post_id):
-        db.commit()
+        _commit_public_change(db)
+    return RedirectResponse(url="/admin/posts", status_code=303)
+
+
+@router.post("/posts/bulk-delete")
+def bulk_delete_posts(request: Request, ids: list[int] = Form(default=[]), db: Session = Depends(get_db)):
+    if not _is_auth(request):
+        return RedirectResponse(url="/admin/login", status_code=303)
+    if soft_delete_posts(db, ids):
+        _commit_public_change(db)
+    return RedirectResponse(url="/admin/posts", status_code=303)
+
+
+@router.post("/posts/bulk-restore")
+def bulk_restore_posts(request: Request, ids: list[int] = Form(default=[]), db: Session = Depends(get_db)):
+    if not _is_auth(request):
+        return RedirectResponse(url="/admin/login", status_code=303)
+    if restore_posts(db, ids):
+        _commit_public_change(db)
     return RedirectResponse(url="/admin/posts", status_code=303)
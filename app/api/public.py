@@ -1,27 +1,57 @@
-from datetime import datetime
+import hashlib
+from datetime import UTC, datetime, timedelta
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Depends, Query, Request
-from fastapi.responses import JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
 from app.database import get_db
 from app.schemas import PostOut, TopicOut
+from app.security import SESSION_KEY
+from app.services.cache import TTLCache
 from app.services.map_service import build_map, build_map_v2, parse_period
 from app.services.repository import (
+    MAP_STATS_COLUMNS,
     count_posts_for_map,
+    count_stats_posts_for_map,
     get_post,
     get_topic,
     list_posts,
+    map_stats_fresh,
     topic_activity_for_map,
+    topic_stats_for_map,
     topic_posts_paginated,
+    topic_points_from_stats,
     topics_for_map,
 )
+from app.templating import templates
 
+settings = get_settings()
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+response_cache = TTLCache(ttl_seconds=settings.response_cache_ttl_seconds, max_entries=256)
+map_render_cache = TTLCache(ttl_seconds=settings.map_render_cache_ttl_seconds, max_entries=64)
+# Last moderation commit in this process; map stats rebuilt before it are ignored.
+_public_data_changed_at: datetime | None = None
+
+
+def invalidate_public_caches() -> None:
+    """Call after committing a change that public pages show; stats catch up on the next scheduled refresh."""
+    global _public_data_changed_at
+    _public_data_changed_at = datetime.now(UTC)
+    response_cache.clear()
+    map_render_cache.clear()
+
+
+def _use_response_cache(request: Request) -> bool:
+    return response_cache.enabled and not request.session.get(SESSION_KEY)
+
+
+def _cache_headers(cached: bool) -> dict[str, str]:
+    if not cached:
+        return {}
+    return {"Cache-Control": f"public, max-age={response_cache.ttl_seconds}"}
 
 
 def _is_preview_image_source(source_url: str) -> bool:
@@ -89,6 +119,7 @@ def health():
 
 @router.get("/api/posts", response_model=list[PostOut])
 def api_posts(
+    request: Request,
     since: datetime | None = Query(default=None),
     has_geo: bool = Query(default=True),
     include_deleted: bool = Query(default=False),
@@ -97,15 +128,23 @@ def api_posts(
     offset: int = Query(default=0, ge=0),
     db: Session = Depends(get_db),
 ):
-    return list_posts(
-        db,
-        since=since,
-        has_geo=has_geo,
-        include_deleted=include_deleted,
-        q=q,
-        limit=limit,
-        offset=offset,
-    )
+    use_cache = _use_response_cache(request)
+    cache_key = ("api_posts", since, has_geo, include_deleted, q, limit, offset)
+    payload = response_cache.get(cache_key) if use_cache else None
+    if payload is None:
+        posts = list_posts(
+            db,
+            since=since,
+            has_geo=has_geo,
+            include_deleted=include_deleted,
+            q=q,
+            limit=limit,
+            offset=offset,
+        )
+        payload = [PostOut.model_validate(post).model_dump(mode="json") for post in posts]
+        if use_cache:
+            response_cache.set(cache_key, payload)
+    return ORJSONResponse(payload, headers=_cache_headers(use_cache))
 
 
 @router.get("/api/posts/{post_id}", response_model=PostOut)
@@ -160,6 +199,84 @@ def api_topic_messages(
     }
 
 
+def _map_fingerprint(use_v2: bool, rows) -> str:
+    digest = hashlib.blake2b(b"v2" if use_v2 else b"legacy", digest_size=16)
+    for row in rows:
+        if use_v2:
+            topic, posts_count, last_post_at = row
+            extra = (posts_count, last_post_at.isoformat() if last_post_at else "")
+        else:
+            topic, extra = row, ()
+        key = (topic.id, topic.geocoded_lat, topic.geocoded_lon, topic.title, topic.place_name, topic.url, *extra)
+        digest.update(repr(key).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stats_period(db: Session, period: str, q: str | None) -> str | None:
+    """Period column of topic_map_stats that can answer this view, if the table is fresh enough."""
+    if q or settings.map_stats_refresh_seconds <= 0:
+        return None
+    stats_period = period if period in MAP_STATS_COLUMNS else "all"
+    max_age = timedelta(seconds=settings.map_stats_refresh_seconds * 3)
+    return stats_period if map_stats_fresh(db, max_age, changed_since=_public_data_changed_at) else None
+
+
+def _render_map(
+    db: Session, period: str, since: datetime | None, q: str | None, limit: int, use_v2: bool
+) -> tuple[str, int, int, str]:
+    stats_period = _stats_period(db, period, q)
+    if use_v2 and stats_period:
+        rows = topic_stats_for_map(
+            db,
+            period=stats_period,
+            limit=limit,
+            min_geo_confidence=settings.min_geo_confidence,
+        )
+    elif use_v2:
+        rows = topic_activity_for_map(
+            db,
+            since=since,
+            q=q,
+            limit=limit,
+            min_geo_confidence=settings.min_geo_confidence,
+        )
+    elif stats_period:
+        rows = topic_points_from_stats(
+            db,
+            period=stats_period,
+            limit=limit,
+            min_geo_confidence=settings.min_geo_confidence,
+        )
+    else:
+        rows = topics_for_map(
+            db,
+            since=since,
+            q=q,
+            limit=limit,
+            min_geo_confidence=settings.min_geo_confidence,
+        )
+
+    # Folium rendering dominates the request; reuse it while the plotted rows are unchanged.
+    fingerprint = _map_fingerprint(use_v2, rows)
+    map_html = map_render_cache.get(fingerprint)
+    if map_html is None:
+        map_html = build_map_v2(rows) if use_v2 else build_map(rows)
+        map_render_cache.set(fingerprint, map_html)
+
+    if stats_period:
+        posts_count = count_stats_posts_for_map(
+            db, period=stats_period, min_geo_confidence=settings.min_geo_confidence
+        )
+    else:
+        posts_count = count_posts_for_map(
+            db,
+            since=since,
+            q=q,
+            min_geo_confidence=settings.min_geo_confidence,
+        )
+    return map_html, len(rows), posts_count, fingerprint
+
+
 @router.get("/")
 def home(
     request: Request,
@@ -169,7 +286,6 @@ def home(
     ui: str | None = Query(default=None),
     db: Session = Depends(get_db),
 ):
-    settings = get_settings()
     since = parse_period(period)
     if ui == "legacy":
         use_v2 = False
@@ -178,43 +294,35 @@ def home(
     else:
         use_v2 = settings.map_ui_v2
 
-    if use_v2:
-        topic_rows = topic_activity_for_map(
-            db,
-            since=since,
-            q=q,
-            limit=limit,
-            min_geo_confidence=settings.min_geo_confidence,
-        )
-        map_html = build_map_v2(topic_rows)
-        topics_count = len(topic_rows)
-    else:
-        topics = topics_for_map(
-            db,
-            since=since,
-            q=q,
-            limit=limit,
-            min_geo_confidence=settings.min_geo_confidence,
+    use_cache = _use_response_cache(request)
+    cache_key = ("home", period, q, limit, use_v2)
+    cached = response_cache.get(cache_key) if use_cache else None
+    if cached is None:
+        map_html, topics_count, posts_count, fingerprint = _render_map(
+            db, period=period, since=since, q=q, limit=limit, use_v2=use_v2
         )
-        map_html = build_map(topics)
-        topics_count = len(topics)
-
-    posts_count = count_posts_for_map(
-        db,
-        since=since,
-        q=q,
-        min_geo_confidence=settings.min_geo_confidence,
-    )
-    return templates.TemplateResponse(
-        "map.html",
-        {
-            "request": request,
-            "map_html": map_html,
-            "period": period,
-            "q": q or "",
-            "limit": limit,
-            "topics_count": topics_count,
-            "posts_count": posts_count,
-            "ui_mode": "v2" if use_v2 else "legacy",
-        },
-    )
+        page_key = f"{fingerprint}|{period}|{q or ''}|{limit}|{topics_count}|{posts_count}"
+        etag = '"' + hashlib.blake2b(page_key.encode("utf-8"), digest_size=16).hexdigest() + '"'
+        # The page embeds the whole folium document; keep the encoded body so cache hits
+        # skip re-rendering and re-encoding several megabytes per request.
+        body = templates.get_template("map.html").render(
+            {
+                "request": request,
+                "map_html": map_html,
+                "period": period,
+                "q": q or "",
+                "limit": limit,
+                "topics_count": topics_count,
+                "posts_count": posts_count,
+                "ui_mode": "v2" if use_v2 else "legacy",
+            }
+        ).encode("utf-8")
+        cached = (etag, body)
+        if use_cache:
+            response_cache.set(cache_key, cached)
+
+    etag, body = cached
+    headers = {**_cache_headers(use_cache), "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
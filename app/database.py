@@ -9,9 +9,37 @@ class Base(DeclarativeBase):
 
 
 settings = get_settings()
-engine = create_engine(settings.database_url, future=True, pool_pre_ping=True)
+
+
+def _create_engine(pool_size: int, max_overflow: int, *server_options: str):
+    server_options = (f"statement_timeout={settings.db_statement_timeout_ms}", *server_options)
+    options = " ".join(f"-c {option}" for option in server_options)
+    return create_engine(
+        settings.database_url,
+        future=True,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+        query_cache_size=settings.db_query_cache_size,
+        connect_args={"options": options},
+    )
+
+
+engine = _create_engine(settings.db_pool_size, settings.db_max_overflow)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session, future=True)
 
+# Background scraping gets its own small pool so a long sync cannot starve request handlers.
+# Its per-topic commits need not wait for the WAL flush: a crash loses at most the last
+# fraction of a second of scraped rows, which the next sync fetches again.
+scrape_engine = _create_engine(
+    settings.db_scrape_pool_size,
+    0,
+    f"synchronous_commit={'on' if settings.db_scrape_synchronous_commit else 'off'}",
+)
+ScrapeSessionLocal = sessionmaker(bind=scrape_engine, autocommit=False, autoflush=False, class_=Session, future=True)
+
 
 def get_db():
     db = SessionLocal()
@@ -1,36 +1,44 @@
 import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
+from datetime import UTC, datetime
 from pathlib import Path
 
+from anyio import to_thread
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.api.admin import router as admin_router
 from app.api.public import router as public_router
 from app.config import get_settings
-from app.database import SessionLocal
-from app.services.sync_service import SyncService
+from app.database import ScrapeSessionLocal
+from app.services.repository import refresh_topic_map_stats
+from app.services.sync_service import get_sync_service
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-settings = get_settings()
-app = FastAPI(title="Fishing Map MVP")
-app.add_middleware(SessionMiddleware, secret_key=settings.secret_key, https_only=False, same_site="lax")
-Path(settings.attachments_dir).mkdir(parents=True, exist_ok=True)
-app.mount("/media/attachments", StaticFiles(directory=settings.attachments_dir), name="attachments")
 
-app.include_router(public_router)
-app.include_router(admin_router)
+class NonMediaGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        # Attachment images are already compressed; only HTML/JSON benefits from gzip.
+        if scope["type"] == "http" and scope["path"].startswith("/media/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
+
+settings = get_settings()
 scheduler = AsyncIOScheduler()
-sync_service = SyncService()
+sync_service = get_sync_service()
 
 
 async def scrape_job():
-    db = SessionLocal()
+    db = ScrapeSessionLocal()
     try:
         await sync_service.run(db)
     except Exception:
@@ -40,13 +48,50 @@ async def scrape_job():
         db.close()
 
 
-@app.on_event("startup")
-async def startup_event():
+def refresh_map_stats_job():
+    # Plain function: APScheduler runs it in its thread pool, off the event loop.
+    db = ScrapeSessionLocal()
+    try:
+        refresh_topic_map_stats(db)
+        db.commit()
+    except Exception:
+        logger.exception("Refreshing map stats failed")
+        db.rollback()
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync route handlers run in AnyIO's worker threads; size the pool explicitly.
+    to_thread.current_default_thread_limiter().total_tokens = max(1, settings.threadpool_size)
     scheduler.add_job(scrape_job, "interval", seconds=settings.fetch_interval_seconds, id="scrape_forum", replace_existing=True)
+    if settings.map_stats_refresh_seconds > 0:
+        scheduler.add_job(
+            refresh_map_stats_job,
+            "interval",
+            seconds=settings.map_stats_refresh_seconds,
+            id="refresh_map_stats",
+            replace_existing=True,
+            next_run_time=datetime.now(UTC),
+        )
     scheduler.start()
-    asyncio.create_task(scrape_job())
+    initial_scrape = asyncio.create_task(scrape_job())
+    try:
+        yield
+    finally:
+        scheduler.shutdown(wait=False)
+        initial_scrape.cancel()
+        with suppress(asyncio.CancelledError):
+            await initial_scrape
+        await sync_service.aclose()
 
 
-@app.on_event("shutdown")
-def shutdown_event():
-    scheduler.shutdown(wait=False)
+app = FastAPI(title="Fishing Map MVP", default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(SessionMiddleware, secret_key=settings.secret_key, https_only=False, same_site="lax")
+app.add_middleware(NonMediaGZipMiddleware, minimum_size=1024, compresslevel=5)
+Path(settings.attachments_dir).mkdir(parents=True, exist_ok=True)
+app.mount("/media/attachments", StaticFiles(directory=settings.attachments_dir), name="attachments")
+
+app.include_router(public_router)
+app.include_router(admin_router)
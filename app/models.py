@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint, func, text
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -20,7 +21,25 @@ class Topic(Base):
     __tablename__ = "topics"
     __table_args__ = (
         UniqueConstraint("source_id", "external_id", name="uq_topics_source_external"),
-        Index("ix_topics_geocoded_lat_lon", "geocoded_lat", "geocoded_lon"),
+        Index(
+            "ix_topics_geocoded",
+            "geocoded_lat",
+            "geocoded_lon",
+            "geocode_confidence",
+            postgresql_where=text("geocoded_lat IS NOT NULL AND geocoded_lon IS NOT NULL"),
+        ),
+        Index(
+            "ix_topics_geocoded_last_seen",
+            text("last_seen_at DESC"),
+            postgresql_where=text("geocoded_lat IS NOT NULL AND geocoded_lon IS NOT NULL"),
+        ),
+        Index("ix_topics_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        Index(
+            "ix_topics_place_name_trgm",
+            "place_name",
+            postgresql_using="gin",
+            postgresql_ops={"place_name": "gin_trgm_ops"},
+        ),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -44,8 +63,29 @@ class Post(Base):
     __tablename__ = "posts"
     __table_args__ = (
         UniqueConstraint("topic_id", "external_id", name="uq_posts_topic_external"),
-        Index("ix_posts_posted_at_utc", "posted_at_utc"),
-        Index("ix_posts_is_deleted", "is_deleted"),
+        Index("ix_posts_posted_at_id", "posted_at_utc", "id"),
+        Index(
+            "ix_posts_active_recent",
+            text("posted_at_utc DESC"),
+            text("id DESC"),
+            postgresql_using="btree",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_posts_topic_active",
+            "topic_id",
+            text("posted_at_utc DESC"),
+            postgresql_using="btree",
+            postgresql_where=text("deleted_at IS NULL"),
+            postgresql_include=["id"],
+        ),
+        Index(
+            "ix_posts_content_trgm",
+            "content_text",
+            postgresql_using="gin",
+            postgresql_ops={"content_text": "gin_trgm_ops"},
+        ),
+        Index("ix_posts_author_trgm", "author", postgresql_using="gin", postgresql_ops={"author": "gin_trgm_ops"}),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -59,7 +99,6 @@ class Post(Base):
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
     )
-    is_deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
     deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     topic: Mapped[Topic] = relationship("Topic", back_populates="posts")
@@ -67,12 +106,32 @@ class Post(Base):
         "PostAttachment", back_populates="post", cascade="all, delete-orphan"
     )
 
+    @hybrid_property
+    def is_deleted(self) -> bool:
+        return self.deleted_at is not None
+
+    @is_deleted.inplace.expression
+    @classmethod
+    def _is_deleted_expression(cls):
+        return cls.deleted_at.is_not(None)
+
 
 class PostAttachment(Base):
     __tablename__ = "post_attachments"
     __table_args__ = (
         UniqueConstraint("post_id", "source_url", name="uq_post_attachments_post_source_url"),
         Index("ix_post_attachments_post_id", "post_id"),
+        Index(
+            "ix_post_attachments_missing",
+            text("post_id DESC"),
+            postgresql_where=text("local_rel_path IS NULL"),
+        ),
+        Index(
+            "ix_post_attachments_file_name_trgm",
+            "file_name",
+            postgresql_using="gin",
+            postgresql_ops={"file_name": "gin_trgm_ops"},
+        ),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -80,9 +139,35 @@ class PostAttachment(Base):
     source_url: Mapped[str] = mapped_column(String(2048), nullable=False)
     file_name: Mapped[str] = mapped_column(String(512), nullable=False)
     mime_type: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    size_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     local_rel_path: Mapped[str | None] = mapped_column(String(1024), nullable=True)
     is_image: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     post: Mapped[Post] = relationship("Post", back_populates="attachments")
+
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+
+    place_key: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    provider: Mapped[str] = mapped_column(String(32), primary_key=True)
+    lat: Mapped[float] = mapped_column(Float, nullable=False)
+    lon: Mapped[float] = mapped_column(Float, nullable=False)
+    confidence: Mapped[float] = mapped_column(Float, nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class TopicMapStats(Base):
+    """Per-topic active post counts for each map period, refreshed in the background."""
+
+    __tablename__ = "topic_map_stats"
+    __table_args__ = (Index("ix_topic_map_stats_last_post_at", text("last_post_at DESC")),)
+
+    topic_id: Mapped[int] = mapped_column(ForeignKey("topics.id", ondelete="CASCADE"), primary_key=True)
+    posts_24h: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    posts_7d: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    posts_30d: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    posts_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_post_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    refreshed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -1,3 +1,4 @@
+import hashlib
 import secrets
 
 from app.config import get_settings
@@ -5,6 +6,14 @@ from app.config import get_settings
 SESSION_KEY = "admin_authenticated"
 
 
+def _digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+
 def verify_admin_credentials(username: str, password: str) -> bool:
     settings = get_settings()
-    return secrets.compare_digest(username, settings.admin_user) and secrets.compare_digest(password, settings.admin_password)
+    # Compare fixed-size digests of the UTF-8 bytes: str compare_digest rejects non-ASCII input,
+    # and evaluating both checks keeps the timing independent of which one failed.
+    user_ok = secrets.compare_digest(_digest(username), _digest(settings.admin_user))
+    password_ok = secrets.compare_digest(_digest(password), _digest(settings.admin_password))
+    return user_ok and password_ok
@@ -9,6 +9,16 @@ from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
+_LOGIN_RETRY_AFTER_RES = tuple(
+    re.compile(pattern, flags=re.IGNORECASE)
+    for pattern in (
+        r"подождать\s+не\s+менее\s+(\d+)\s+сек",
+        r"подождать\s+(\d+)\s+сек",
+        r"wait\s+at\s+least\s+(\d+)\s+seconds?",
+        r"please\s+wait\s+(\d+)\s+seconds?",
+    )
+)
+
 
 class ForumAuthService:
     def __init__(
@@ -31,6 +41,8 @@ class ForumAuthService:
         self.user_agent = user_agent
         self.fallback_cookie = fallback_cookie.strip()
         self.preferred_cookie_name = preferred_cookie_name.strip()
+        self._login_url = self._resolve_login_url()
+        self._login_headers = {"User-Agent": self.user_agent}
 
         self._cookie_lock = asyncio.Lock()
         self._cached_cookie = "" if (self.username and self.password) else self.fallback_cookie
@@ -51,7 +63,7 @@ class ForumAuthService:
 
     @staticmethod
     def _extract_form_payload(html: str, page_url: str) -> tuple[str, dict[str, str]]:
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, "lxml")
         form = soup.select_one("form[action*='login/login']")
         if not form:
             for candidate in soup.select("form"):
@@ -82,11 +94,12 @@ class ForumAuthService:
         if not cookies:
             return ""
 
-        ordered_names: list[str] = []
-        if self.preferred_cookie_name and self.preferred_cookie_name in cookies:
-            ordered_names.append(self.preferred_cookie_name)
-        ordered_names.extend(name for name in cookies if name not in ordered_names)
-        return "; ".join(f"{name}={cookies[name]}" for name in ordered_names)
+        preferred = self.preferred_cookie_name
+        if not preferred or preferred not in cookies:
+            return "; ".join(f"{name}={value}" for name, value in cookies.items())
+        rest = "; ".join(f"{name}={value}" for name, value in cookies.items() if name != preferred)
+        head = f"{preferred}={cookies[preferred]}"
+        return f"{head}; {rest}" if rest else head
 
     @staticmethod
     def _cookie_names(client: httpx.AsyncClient) -> str:
@@ -97,7 +110,7 @@ class ForumAuthService:
     def _has_login_form(html: str) -> bool:
         if not html:
             return False
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, "lxml")
         if soup.select_one("form[action*='login/login']"):
             return True
         for candidate in soup.select("form"):
@@ -114,7 +127,7 @@ class ForumAuthService:
             return True
         if "/logout/" in lowered:
             return True
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, "lxml")
         if soup.select_one("a[href*='/logout/'], form[action*='/logout/']"):
             return True
         return False
@@ -123,15 +136,9 @@ class ForumAuthService:
     def _extract_login_retry_after_seconds(html: str) -> int | None:
         if not html:
             return None
-        text = BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
-        patterns = [
-            r"подождать\s+не\s+менее\s+(\d+)\s+сек",
-            r"подождать\s+(\d+)\s+сек",
-            r"wait\s+at\s+least\s+(\d+)\s+seconds?",
-            r"please\s+wait\s+(\d+)\s+seconds?",
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text, flags=re.IGNORECASE)
+        text = BeautifulSoup(html, "lxml").get_text(" ", strip=True)
+        for pattern in _LOGIN_RETRY_AFTER_RES:
+            match = pattern.search(text)
             if not match:
                 continue
             try:
@@ -152,14 +159,15 @@ class ForumAuthService:
         return int(remaining) + 1
 
     async def _login(self) -> str:
-        login_url = self._resolve_login_url()
+        login_url = self._login_url
         if not login_url:
             logger.warning("Forum login URL is empty; cannot auto-refresh forum cookie")
             return ""
 
-        headers = {"User-Agent": self.user_agent}
         try:
-            async with httpx.AsyncClient(timeout=self.timeout_seconds, headers=headers, follow_redirects=True) as client:
+            async with httpx.AsyncClient(
+                timeout=self.timeout_seconds, headers=self._login_headers, follow_redirects=True
+            ) as client:
                 login_page = await client.get(login_url)
                 login_page.raise_for_status()
 
@@ -214,9 +222,12 @@ class ForumAuthService:
             logger.warning("Forum auto-login failed: %s", exc)
             return ""
 
-    async def ensure_cookie(self, force_refresh: bool = False) -> str:
+    async def ensure_cookie(self, force_refresh: bool = False, stale_cookie: str | None = None) -> str:
         if not self.has_credentials:
             return self.fallback_cookie
+        # Warm path: no lock round trip for the common case of a cached cookie.
+        if self._cached_cookie and not force_refresh:
+            return self._cached_cookie
 
         async with self._cookie_lock:
             cooldown = self._remaining_login_retry_seconds()
@@ -228,7 +239,9 @@ class ForumAuthService:
                 )
                 return self._cached_cookie or self.fallback_cookie
 
-            if self._cached_cookie and not force_refresh:
+            # stale_cookie is the cookie the caller saw rejected. If another task has already
+            # replaced it, reuse that one, so concurrent download failures trigger a single login.
+            if self._cached_cookie and (not force_refresh or (stale_cookie and self._cached_cookie != stale_cookie)):
                 return self._cached_cookie
 
             fresh_cookie = await self._login()
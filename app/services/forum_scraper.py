@@ -1,18 +1,66 @@
 import asyncio
 import logging
+import random
 import re
+import time
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import UTC, datetime
-from pathlib import Path
+from email.utils import parsedate_to_datetime
 from urllib.parse import urljoin, urlparse
 from urllib.robotparser import RobotFileParser
 
 import httpx
 from bs4 import BeautifulSoup
 from dateutil import parser as date_parser
+from lxml import etree
+from lxml import html as lxml_html
+
+from app.services.rate_limit import AsyncRateLimiter
 
 logger = logging.getLogger(__name__)
 
+_TOPIC_ID_RE = re.compile(r"\.(\d+)(?:/|$)")
+_NUM_RE = re.compile(r"(\d+)")
+_WS_RE = re.compile(r"\s+")
+_PAGE_RE = re.compile(r"/page-(\d+)")
+_UNREAD_SUFFIX_RE = re.compile(r"/unread/?$")
+_IMAGE_EXTS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"})
+_IMAGE_TOKEN_RE = re.compile(r"(?:^|[-_.])(jpg|jpeg|png|gif|webp|bmp)(?:[.-]\d+)?$")
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Topic pages are parsed with precompiled XPath; each mirrors the CSS selector noted beside it.
+# article.message, div.message
+_MESSAGES_XP = etree.XPath(f"//article[{_has_class('message')}] | //div[{_has_class('message')}]")
+# a.username, h4.message-name, span.username
+_AUTHOR_XP = etree.XPath(
+    f".//a[{_has_class('username')}] | .//h4[{_has_class('message-name')}] | .//span[{_has_class('username')}]"
+)
+_TIME_XP = etree.XPath(".//time")
+# div.bbWrapper, article.message-body, div.message-content
+_CONTENT_XP = etree.XPath(
+    f".//div[{_has_class('bbWrapper')}] | .//article[{_has_class('message-body')}]"
+    f" | .//div[{_has_class('message-content')}]"
+)
+_PERMALINK_XP = etree.XPath(".//a[contains(@href, '/posts/')]")
+# a[href*='/attachments/'], img[src*='/attachments/']
+_ATTACHMENT_NODES_XP = etree.XPath(".//a[contains(@href, '/attachments/')] | .//img[contains(@src, '/attachments/')]")
+# .attachment, .attachments, .message-attachments, .js-attachmentInfo, .bbCodeBlock--unfurl
+_CONTENT_NOISE_XP = etree.XPath(
+    ".//*[{}]".format(
+        " or ".join(
+            _has_class(name)
+            for name in ("attachment", "attachments", "message-attachments", "js-attachmentInfo", "bbCodeBlock--unfurl")
+        )
+    )
+)
+# Same strings BeautifulSoup's get_text() yields: script/style bodies and comments are skipped.
+_TEXT_XP = etree.XPath(".//text()[not(ancestor::script or ancestor::style)]", smart_strings=False)
+
 
 @dataclass
 class ScrapedTopic:
@@ -56,14 +104,57 @@ class ForumScraper:
         self.max_forum_pages = max_forum_pages
         self.max_topic_pages = max_topic_pages
         self.timeout_seconds = timeout_seconds
-        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
-        self.sleep_seconds = 1.0 / max(0.1, requests_per_second)
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = AsyncRateLimiter(max(0.1, requests_per_second))
         self.user_agent = user_agent
         self.forum_session_cookie = forum_session_cookie
         self._robot_parser: RobotFileParser | None = None
+        self._robots_lock = asyncio.Lock()
+        self._robots_retry_not_before: float = 0.0
+        self._robots_cache: dict[str, bool] = {}
+        self._client: httpx.AsyncClient | None = None
+        self._client_users = 0
+
+    async def __aenter__(self) -> "ForumScraper":
+        if self._client is None:
+            self._client = self._new_client()
+        self._client_users += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._client_users -= 1
+        if self._client_users == 0 and self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self.timeout_seconds,
+            headers=self._headers(),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=self.max_concurrency,
+                max_connections=self.max_concurrency * 2,
+            ),
+        )
+
+    @asynccontextmanager
+    async def _session(self):
+        # Reuse the shared keep-alive client inside `async with scraper:`; otherwise open a short-lived one.
+        if self._client is not None:
+            yield self._client
+            return
+        async with self._new_client() as client:
+            yield client
 
     def set_forum_session_cookie(self, cookie: str) -> None:
         self.forum_session_cookie = cookie
+        if self._client is not None:
+            if cookie:
+                self._client.headers["Cookie"] = cookie
+            else:
+                self._client.headers.pop("Cookie", None)
 
     def _headers(self) -> dict[str, str]:
         headers = {"User-Agent": self.user_agent}
@@ -71,39 +162,94 @@ class ForumScraper:
             headers["Cookie"] = self.forum_session_cookie
         return headers
 
-    async def _allowed_by_robots(self, url: str) -> bool:
-        if self._robot_parser is None:
+    async def _ensure_robots(self, client: httpx.AsyncClient) -> RobotFileParser | None:
+        if self._robot_parser is not None or time.monotonic() < self._robots_retry_not_before:
+            return self._robot_parser
+        async with self._robots_lock:
+            if self._robot_parser is not None or time.monotonic() < self._robots_retry_not_before:
+                return self._robot_parser
             parsed = urlparse(self.forum_root_url)
             robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
             rp = RobotFileParser()
             rp.set_url(robots_url)
             try:
-                rp.read()
+                response = await client.get(robots_url)
             except Exception as exc:
                 logger.warning("Could not read robots.txt (%s), fallback allow", exc)
-                return True
+                self._robots_retry_not_before = time.monotonic() + 600
+                return None
+            # Same status handling as RobotFileParser.read().
+            if response.status_code in {401, 403}:
+                rp.disallow_all = True
+            elif 400 <= response.status_code < 500:
+                rp.allow_all = True
+            elif response.status_code >= 500:
+                logger.warning("Could not read robots.txt (HTTP %s), fallback allow", response.status_code)
+                self._robots_retry_not_before = time.monotonic() + 600
+                return None
+            else:
+                rp.parse(response.text.splitlines())
             self._robot_parser = rp
-        return self._robot_parser.can_fetch(self.user_agent, url)
+            self._robots_cache.clear()
+            return rp
+
+    async def _allowed_by_robots(self, client: httpx.AsyncClient, url: str) -> bool:
+        rp = await self._ensure_robots(client)
+        if rp is None:
+            return True
+        parsed = urlparse(url)
+        key = f"{parsed.path}?{parsed.query}"
+        allowed = self._robots_cache.get(key)
+        if allowed is None:
+            if len(self._robots_cache) >= 4096:
+                self._robots_cache.clear()
+            allowed = rp.can_fetch(self.user_agent, url)
+            self._robots_cache[key] = allowed
+        return allowed
 
     async def _fetch(self, client: httpx.AsyncClient, url: str) -> str:
-        if not await self._allowed_by_robots(url):
+        if not await self._allowed_by_robots(client, url):
             logger.warning("Blocked by robots.txt: %s", url)
             return ""
         retries = 3
         for attempt in range(1, retries + 1):
             try:
+                # The limiter paces request starts; the semaphore only bounds requests in flight.
+                await self.rate_limiter.acquire()
                 async with self.semaphore:
                     response = await client.get(url)
                     response.raise_for_status()
-                    await asyncio.sleep(self.sleep_seconds)
                     return response.text
             except Exception as exc:
-                if attempt == retries:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None or attempt == retries:
                     logger.error("Fetch failed %s: %s", url, exc)
                     return ""
-                await asyncio.sleep(attempt * 1.0)
+                await asyncio.sleep(delay)
         return ""
 
+    @staticmethod
+    def _retry_delay(exc: Exception, attempt: int) -> float | None:
+        """Seconds to wait before retrying, or None when retrying cannot help."""
+        backoff = min(30.0, 2.0**attempt) + random.uniform(0, 0.5)
+        if not isinstance(exc, httpx.HTTPStatusError):
+            return backoff
+        status = exc.response.status_code
+        if status in (429, 503):
+            retry_after = exc.response.headers.get("Retry-After", "")
+            try:
+                return min(120.0, max(0.0, float(retry_after))) + random.uniform(0, 0.5)
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(120.0, max(0.0, (retry_at - datetime.now(UTC)).total_seconds()))
+            except (TypeError, ValueError):
+                return backoff
+        if 400 <= status < 500 and status != 408:
+            return None
+        return backoff
+
     @staticmethod
     def normalize_url(base: str, href: str) -> str:
         return urljoin(base, href)
@@ -139,55 +285,77 @@ class ForumScraper:
 
     @staticmethod
     def extract_topic_external_id(url: str) -> str:
-        m = re.search(r"\.(\d+)(?:/|$)", url)
+        m = _TOPIC_ID_RE.search(url)
         return m.group(1) if m else url.rstrip("/").split("/")[-1]
 
     @staticmethod
     def extract_post_external_id(tag) -> str:
         candidates = [tag.get("id", ""), tag.get("data-content", "")]
         for candidate in candidates:
-            m = re.search(r"(\d+)", candidate)
+            m = _NUM_RE.search(candidate)
             if m:
                 return m.group(1)
         return ""
 
     @staticmethod
     def clean_text(text: str) -> str:
-        return re.sub(r"\s+", " ", text).strip()
+        return _WS_RE.sub(" ", text).strip()
+
+    @staticmethod
+    def _node_text(node) -> str:
+        return " ".join(stripped for text in _TEXT_XP(node) if (stripped := text.strip()))
 
     def extract_content_text(self, message) -> str:
-        content_tag = message.select_one("div.bbWrapper, article.message-body, div.message-content")
-        if not content_tag:
+        content_nodes = _CONTENT_XP(message)
+        if not content_nodes:
             return ""
+        content_tag = content_nodes[0]
         # Remove attachment metadata blocks from message text.
-        for node in content_tag.select(
-            ".attachment, .attachments, .message-attachments, .js-attachmentInfo, .bbCodeBlock--unfurl"
-        ):
-            node.decompose()
-        return self.clean_text(content_tag.get_text(" ", strip=True))
+        for node in _CONTENT_NOISE_XP(content_tag):
+            node.drop_tree()
+        return self.clean_text(self._node_text(content_tag))
 
     @staticmethod
     def _is_image_filename(name: str) -> bool:
         lowered = (name or "").strip().lower()
-        ext = Path(lowered).suffix
-        if ext in {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}:
+        base = lowered.rsplit("/", maxsplit=1)[-1]
+        dot = base.rfind(".")
+        if dot > 0 and base[dot:] in _IMAGE_EXTS:
             return True
-        return bool(re.search(r"(?:^|[-_.])(jpg|jpeg|png|gif|webp|bmp)(?:[.-]\d+)?$", lowered))
+        return bool(_IMAGE_TOKEN_RE.search(lowered))
+
+    @staticmethod
+    def _url_file_name(url: str) -> str:
+        return urlparse(url).path.rstrip("/").rsplit("/", maxsplit=1)[-1]
 
     def extract_attachments(self, message, page_url: str) -> list[ScrapedAttachment]:
+        links = []
+        images = []
+        for node in _ATTACHMENT_NODES_XP(message):
+            if node.tag == "a":
+                links.append(node)
+            else:
+                images.append(node)
+
         seen: set[str] = set()
         attachments: list[ScrapedAttachment] = []
 
-        for link in message.select("a[href*='/attachments/']"):
-            href = link.get("href")
-            if not href:
-                continue
-            source_url = self.normalize_url(page_url, href)
+        def add(ref: str | None) -> str | None:
+            if not ref:
+                return None
+            source_url = self.normalize_url(page_url, ref)
             if source_url in seen:
-                continue
+                return None
             seen.add(source_url)
-            text_name = self.clean_text(link.get_text(" ", strip=True))
-            file_name = text_name or Path(urlparse(source_url).path).name or "attachment.bin"
+            return source_url
+
+        # Links take precedence over inline images that point at the same URL.
+        for link in links:
+            source_url = add(link.get("href"))
+            if not source_url:
+                continue
+            text_name = self.clean_text(self._node_text(link))
+            file_name = text_name or self._url_file_name(source_url) or "attachment.bin"
             attachments.append(
                 ScrapedAttachment(
                     source_url=source_url,
@@ -196,15 +364,11 @@ class ForumScraper:
                 )
             )
 
-        for img in message.select("img[src*='/attachments/']"):
-            src = img.get("src")
-            if not src:
-                continue
-            source_url = self.normalize_url(page_url, src)
-            if source_url in seen:
+        for img in images:
+            source_url = add(img.get("src"))
+            if not source_url:
                 continue
-            seen.add(source_url)
-            file_name = Path(urlparse(source_url).path).name or "attachment.jpg"
+            file_name = self._url_file_name(source_url) or "attachment.jpg"
             attachments.append(
                 ScrapedAttachment(
                     source_url=source_url,
@@ -220,26 +384,37 @@ class ForumScraper:
 
     @staticmethod
     def parse_datetime_to_utc(value: str) -> datetime:
-        dt = date_parser.parse(value)
+        # XenForo <time datetime> values are ISO-8601; dateutil is only needed for free-form fallbacks.
+        try:
+            dt = datetime.fromisoformat(value.strip())
+        except ValueError:
+            dt = date_parser.parse(value)
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=UTC)
         return dt.astimezone(UTC)
 
     async def fetch_topics(self) -> list[ScrapedTopic]:
         topics: dict[str, ScrapedTopic] = {}
-        async with httpx.AsyncClient(timeout=self.timeout_seconds, headers=self._headers(), follow_redirects=True) as client:
-            for page in range(1, self.max_forum_pages + 1):
-                page_url = self.forum_root_url if page == 1 else f"{self.forum_root_url}page-{page}"
-                html = await self._fetch(client, page_url)
+        page_urls = [
+            self.forum_root_url if page == 1 else f"{self.forum_root_url}page-{page}"
+            for page in range(1, self.max_forum_pages + 1)
+        ]
+        async with self._session() as client:
+            # The semaphore in _fetch bounds concurrency; pages are still parsed in order.
+            htmls = await asyncio.gather(*(self._fetch(client, url) for url in page_urls))
+            for page_url, html in zip(page_urls, htmls):
                 if not html:
                     continue
-                soup = BeautifulSoup(html, "html.parser")
+                soup = BeautifulSoup(html, "lxml")
+                # The selectors overlap on XenForo markup; parse each thread link once per page.
+                seen_hrefs: set[str] = set()
                 for link in soup.select("a[data-tp-primary='on'], a.structItem-title, .structItem-title a"):
                     href = link.get("href")
-                    if not href:
+                    if not href or href in seen_hrefs:
                         continue
+                    seen_hrefs.add(href)
                     topic_url = self.normalize_url(page_url, href)
-                    topic_url = re.sub(r"/unread/?$", "/", topic_url)
+                    topic_url = _UNREAD_SUFFIX_RE.sub("/", topic_url)
                     if "/threads/" not in topic_url:
                         continue
                     title = self.clean_text(link.get_text(" ", strip=True))
@@ -252,45 +427,64 @@ class ForumScraper:
                     )
         return list(topics.values())
 
-    async def _topic_last_page(self, client: httpx.AsyncClient, topic_url: str) -> int:
-        html = await self._fetch(client, topic_url)
-        if not html:
-            return 1
-        soup = BeautifulSoup(html, "html.parser")
+    @staticmethod
+    def _last_page_number(soup: BeautifulSoup) -> int:
+        # XenForo renders the last page as the final pageNav item; only scan every link on other markup.
+        last_link = soup.select_one(".pageNav-jump--end, .pageNav-main li.pageNav-page:last-child a")
+        if last_link is not None:
+            m = _PAGE_RE.search(last_link.get("href", ""))
+            if m:
+                return max(1, int(m.group(1)))
         pages = [1]
         for a in soup.select("a[href*='/page-']"):
-            href = a.get("href", "")
-            m = re.search(r"/page-(\d+)", href)
+            m = _PAGE_RE.search(a.get("href", ""))
             if m:
                 pages.append(int(m.group(1)))
         return max(pages)
 
+    async def _topic_last_page(self, client: httpx.AsyncClient, topic_url: str) -> tuple[int, str]:
+        """Return the topic's last page number and the first page HTML, so the caller can reuse it."""
+        html = await self._fetch(client, topic_url)
+        if not html:
+            return 1, ""
+        return self._last_page_number(BeautifulSoup(html, "lxml")), html
+
     async def fetch_topic_posts(self, topic: ScrapedTopic) -> list[ScrapedPost]:
         posts: dict[str, ScrapedPost] = {}
-        async with httpx.AsyncClient(timeout=self.timeout_seconds, headers=self._headers(), follow_redirects=True) as client:
-            last_page = await self._topic_last_page(client, topic.url)
+        async with self._session() as client:
+            last_page, first_page_html = await self._topic_last_page(client, topic.url)
             start_page = max(1, last_page - self.max_topic_pages + 1)
-            for page in range(start_page, last_page + 1):
-                page_url = topic.url if page == 1 else f"{topic.url}page-{page}"
-                html = await self._fetch(client, page_url)
+            page_urls = [
+                topic.url if page == 1 else f"{topic.url}page-{page}" for page in range(start_page, last_page + 1)
+            ]
+            # Page 1 was already fetched to find the last page; only request the rest.
+            remaining_urls = page_urls[1:] if start_page == 1 else page_urls
+            htmls = list(await asyncio.gather(*(self._fetch(client, url) for url in remaining_urls)))
+            if start_page == 1:
+                htmls.insert(0, first_page_html)
+            for page_url, html in zip(page_urls, htmls):
                 if not html:
                     continue
-                soup = BeautifulSoup(html, "html.parser")
-                for message in soup.select("article.message, div.message"):
+                try:
+                    tree = lxml_html.document_fromstring(html)
+                except etree.ParserError:
+                    continue
+                for message in _MESSAGES_XP(tree):
                     post_external_id = self.extract_post_external_id(message)
                     if not post_external_id:
                         continue
-                    author_tag = message.select_one("a.username, h4.message-name, span.username")
-                    author = self.clean_text(author_tag.get_text(" ", strip=True)) if author_tag else "unknown"
-                    time_tag = message.select_one("time")
+                    author_tags = _AUTHOR_XP(message)
+                    author = self.clean_text(self._node_text(author_tags[0])) if author_tags else "unknown"
+                    time_tags = _TIME_XP(message)
                     dt_value = ""
-                    if time_tag:
-                        dt_value = time_tag.get("datetime") or time_tag.get("title") or time_tag.get_text(" ", strip=True)
+                    if time_tags:
+                        time_tag = time_tags[0]
+                        dt_value = time_tag.get("datetime") or time_tag.get("title") or self._node_text(time_tag)
                     if not dt_value:
                         continue
                     content_text = self.extract_content_text(message)
-                    permalink = message.select_one("a[href*='/posts/']")
-                    permalink_href = permalink.get("href") if permalink else None
+                    permalinks = _PERMALINK_XP(message)
+                    permalink_href = permalinks[0].get("href") if permalinks else None
                     post_url = self.build_post_url(topic.url, post_external_id, permalink_href)
                     posts[post_external_id] = ScrapedPost(
                         topic_external_id=topic.external_id,
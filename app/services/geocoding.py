@@ -1,7 +1,14 @@
+import asyncio
 import logging
 from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
 
 import httpx
+from sqlalchemy.orm import Session
+
+from app.services.cache import TTLCache
+from app.services.rate_limit import AsyncRateLimiter
+from app.services.repository import get_cached_geocode, save_cached_geocode
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +22,25 @@ class GeocodeResult:
     raw_address: str | None = None
 
 
+def normalize_place_key(place_name: str) -> str:
+    return " ".join(place_name.lower().split())
+
+
 class BaseGeocoder:
     provider_name: str
+    timeout: int = 20
+    _client: httpx.AsyncClient | None = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # One pooled client per geocoder keeps the TLS session to the provider alive between lookups.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def geocode(self, place_name: str) -> GeocodeResult | None:
         raise NotImplementedError
@@ -40,19 +64,17 @@ class GoogleGeocoder(BaseGeocoder):
         if not self.api_key:
             return None
         params = {"address": f"{place_name}, Россия", "key": self.api_key, "language": "ru"}
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            resp = await client.get("https://maps.googleapis.com/maps/api/geocode/json", params=params)
-            resp.raise_for_status()
-            payload = resp.json()
+        resp = await self._http().get("https://maps.googleapis.com/maps/api/geocode/json", params=params)
+        resp.raise_for_status()
+        payload = resp.json()
         if payload.get("status") != "OK" or not payload.get("results"):
             return None
         if len(payload["results"]) > 1:
             logger.info("Google geocoder returned %s candidates for '%s'", len(payload["results"]), place_name)
-        best = sorted(
+        best = max(
             payload["results"],
             key=lambda x: self.LOCATION_TYPE_SCORE.get(x.get("geometry", {}).get("location_type", "APPROXIMATE"), 0.1),
-            reverse=True,
-        )[0]
+        )
         loc = best["geometry"]["location"]
         confidence = self.LOCATION_TYPE_SCORE.get(best.get("geometry", {}).get("location_type", "APPROXIMATE"), 0.4)
         return GeocodeResult(lat=loc["lat"], lon=loc["lng"], confidence=confidence, provider=self.provider_name)
@@ -73,6 +95,16 @@ class YandexGeocoder(BaseGeocoder):
         self.api_key = api_key
         self.timeout = timeout
 
+    @classmethod
+    def _score(cls, feature: dict) -> float:
+        precision = (
+            feature.get("GeoObject", {})
+            .get("metaDataProperty", {})
+            .get("GeocoderMetaData", {})
+            .get("precision", "other")
+        )
+        return cls.PRECISION_SCORE.get(precision, 0.3)
+
     async def geocode(self, place_name: str) -> GeocodeResult | None:
         if not self.api_key:
             return None
@@ -83,26 +115,16 @@ class YandexGeocoder(BaseGeocoder):
             "results": 5,
             "geocode": f"{place_name}, Россия",
         }
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            resp = await client.get("https://geocode-maps.yandex.ru/1.x/", params=params)
-            resp.raise_for_status()
-            payload = resp.json()
+        resp = await self._http().get("https://geocode-maps.yandex.ru/1.x/", params=params)
+        resp.raise_for_status()
+        payload = resp.json()
         feature_members = payload.get("response", {}).get("GeoObjectCollection", {}).get("featureMember", [])
         if not feature_members:
             return None
 
-        def score(feature):
-            precision = (
-                feature.get("GeoObject", {})
-                .get("metaDataProperty", {})
-                .get("GeocoderMetaData", {})
-                .get("precision", "other")
-            )
-            return self.PRECISION_SCORE.get(precision, 0.3)
-
         if len(feature_members) > 1:
             logger.info("Yandex geocoder returned %s candidates for '%s'", len(feature_members), place_name)
-        best = sorted(feature_members, key=score, reverse=True)[0]
+        best = max(feature_members, key=self._score)
         point = best["GeoObject"]["Point"]["pos"].split()
         lon, lat = float(point[0]), float(point[1])
         precision = best.get("GeoObject", {}).get("metaDataProperty", {}).get("GeocoderMetaData", {}).get("precision", "other")
@@ -111,8 +133,69 @@ class YandexGeocoder(BaseGeocoder):
 
 
 class GeocodingService:
-    def __init__(self, provider: BaseGeocoder):
+    """Provider front-end that remembers results in memory and, given a session, in geocode_cache."""
+
+    def __init__(
+        self,
+        provider: BaseGeocoder,
+        cache_ttl_days: int = 30,
+        memory_cache_size: int = 10_000,
+        concurrency: int = 5,
+        requests_per_second: float = 0.0,
+    ):
         self.provider = provider
-
-    async def geocode(self, place_name: str) -> GeocodeResult | None:
-        return await self.provider.geocode(place_name)
+        self.concurrency = max(1, concurrency)
+        # Only cache misses reach the provider, so only they spend tokens; 0 disables the limit.
+        self.rate_limiter = AsyncRateLimiter(requests_per_second)
+        self.cache_ttl = timedelta(days=cache_ttl_days)
+        self._memory = TTLCache(self.cache_ttl.total_seconds(), max_entries=memory_cache_size)
+
+    async def geocode(self, place_name: str, db: Session | None = None) -> GeocodeResult | None:
+        place_key = normalize_place_key(place_name)
+        memory_key = (self.provider.provider_name, place_key)
+        cached = self._memory.get(memory_key)
+        if cached is not None:
+            return cached
+
+        if db is not None:
+            row = get_cached_geocode(
+                db, place_key, self.provider.provider_name, fresh_since=datetime.now(UTC) - self.cache_ttl
+            )
+            if row is not None:
+                result = GeocodeResult(lat=row.lat, lon=row.lon, confidence=row.confidence, provider=row.provider)
+                self._memory.set(memory_key, result)
+                return result
+
+        await self.rate_limiter.acquire()
+        result = await self.provider.geocode(place_name)
+        if result is None:
+            return None
+        self._memory.set(memory_key, result)
+        if db is not None:
+            # A failed cache write must not abort the caller's transaction for the other lookups.
+            try:
+                with db.begin_nested():
+                    save_cached_geocode(db, place_key, result.provider, result.lat, result.lon, result.confidence)
+            except Exception:
+                logger.exception("Failed caching geocode for '%s'", place_name)
+        return result
+
+    async def geocode_many(self, place_names: list[str], db: Session | None = None) -> list[GeocodeResult | None]:
+        """Geocode several places concurrently; a failed lookup yields None for that place only."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        lookups: dict[str, asyncio.Future] = {}
+
+        async def one(place_name: str) -> GeocodeResult | None:
+            async with semaphore:
+                try:
+                    return await self.geocode(place_name, db=db)
+                except Exception:
+                    logger.exception("Geocoding failed for '%s'", place_name)
+                    return None
+
+        for place_name in place_names:
+            place_key = normalize_place_key(place_name)
+            if place_key not in lookups:
+                lookups[place_key] = asyncio.ensure_future(one(place_name))
+        await asyncio.gather(*lookups.values())
+        return [lookups[normalize_place_key(place_name)].result() for place_name in place_names]
@@ -2,10 +2,13 @@ import html
 import json
 import math
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
 
 import folium
-from branca.element import Element
+from branca.element import Element, MacroElement
 from folium.plugins import HeatMap, MarkerCluster
+from jinja2 import Template
+from sqlalchemy import Row
 
 from app.models import Topic
 
@@ -21,8 +24,8 @@ def parse_period(period: str) -> datetime | None:
     return None
 
 
-def _panel_assets() -> str:
-    return """
+# Static panel markup for the legacy map; built once and wrapped in a fresh Element per render.
+_PANEL_ASSETS = """
     <style>
       #topic-panel {
         position: fixed;
@@ -412,65 +415,84 @@ def _panel_assets() -> str:
     """
 
 
-def build_map(topics: list[Topic]) -> str:
+class _LegacyTopicMarkers(MacroElement):
+    """All legacy topic markers as one GeoJSON layer, with click handlers bound as each feature is added."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        L.geoJson({{ this.data_json }}, {
+          onEachFeature: function(feature, layer) {
+            var props = feature.properties;
+            if (props.tooltip) layer.bindTooltip(props.tooltip);
+            layer.on('click', function() {
+              window.fishingMapOpenTopic(props.id, props.title || '\\u0422\\u043e\\u043f\\u0438\\u043a');
+            });
+          }
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, features: list[dict]):
+        super().__init__()
+        self._name = "LegacyTopicMarkers"
+        collection = {"type": "FeatureCollection", "features": features}
+        self.data_json = json.dumps(collection, ensure_ascii=False).replace("</", "<\\/")
+
+
+def build_map(topics: list[Row]) -> str:
     if topics:
         center = [topics[0].geocoded_lat, topics[0].geocoded_lon]
     else:
         center = [55.751244, 37.618423]
 
     fmap = folium.Map(location=center, zoom_start=6, control_scale=True)
-    fmap.get_root().html.add_child(Element(_panel_assets()))
-
-    for topic in topics:
-        marker = folium.Marker(
-            location=[topic.geocoded_lat, topic.geocoded_lon],
-            tooltip=topic.place_name,
-            topic_id=topic.id,
-            topic_title=topic.title,
-        )
-        marker.add_to(fmap)
-    map_var = fmap.get_name()
-    bind_js = f"""
-    (function() {{
-      function getMap() {{
-        return window['{map_var}'];
-      }}
-      function bindTopicClicks() {{
-        var mapObj = getMap();
-        if (!mapObj) return false;
-        mapObj.eachLayer(function(layer) {{
-          if (!(layer instanceof L.Marker) || !layer.options) return;
-          if (layer._fishingClickBound) return;
-          var topicId = layer.options.topic_id || layer.options.topicId;
-          if (!topicId) return;
-          var topicTitle = layer.options.topic_title || layer.options.topicTitle || '\\u0422\\u043e\\u043f\\u0438\\u043a';
-          layer.on('click', function() {{
-            window.fishingMapOpenTopic(topicId, topicTitle);
-          }});
-          layer._fishingClickBound = true;
-        }});
-        mapObj.on('layeradd', bindTopicClicks);
-        return true;
-      }}
-
-      function waitAndBind(tries) {{
-        if (bindTopicClicks()) return;
-        if (tries <= 0) return;
-        setTimeout(function() {{ waitAndBind(tries - 1); }}, 50);
-      }}
-      waitAndBind(200);
-    }})();
-    """
-    fmap.get_root().script.add_child(Element(bind_js))
+    fmap.get_root().html.add_child(Element(_PANEL_ASSETS))
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [topic.geocoded_lon, topic.geocoded_lat]},
+            "properties": {
+                "id": topic.id,
+                "title": topic.title,
+                "tooltip": html.escape(topic.place_name) if topic.place_name else None,
+            },
+        }
+        for topic in topics
+    ]
+    _LegacyTopicMarkers(features).add_to(fmap)
     return fmap._repr_html_()
 
 
-def _activity_color(last_post_at: datetime | None) -> str:
+_V2_POPUP_TEMPLATE = (
+    "<div style='min-width:220px'>"
+    "<b>{title}</b><br/>"
+    "\u041f\u043e\u0441\u0442\u043e\u0432: {posts_count}<br/>"
+    "\u041f\u043e\u0441\u043b\u0435\u0434\u043d\u0438\u0439 \u043f\u043e\u0441\u0442: {last_post}<br/>"
+    "<a href='{url}' target='_blank' rel='noopener noreferrer'>\u041e\u0442\u043a\u0440\u044b\u0442\u044c \u0442\u043e\u043f\u0438\u043a</a>"
+    "</div>"
+)
+
+
+@lru_cache(maxsize=256)
+def _activity_icon_html(diameter: int, color: str) -> str:
+    # Only a few dozen size/colour combinations exist, so the markup is built once per pair.
+    return (
+        "<div "
+        f"style='width:{diameter}px;height:{diameter}px;border-radius:50%;"
+        f"background:{color};border:2px solid #fff;box-shadow:0 2px 10px rgba(0,0,0,.35);opacity:.92;'>"
+        "</div>"
+    )
+
+
+def _activity_color(last_post_at: datetime | None, now: datetime | None = None) -> str:
     if last_post_at is None:
         return "#64748b"
     if last_post_at.tzinfo is None:
         last_post_at = last_post_at.replace(tzinfo=UTC)
-    age_days = (datetime.now(UTC) - last_post_at.astimezone(UTC)).total_seconds() / 86400
+    age_days = ((now or datetime.now(UTC)) - last_post_at.astimezone(UTC)).total_seconds() / 86400
     if age_days <= 1:
         return "#e63946"
     if age_days <= 7:
@@ -1067,17 +1089,11 @@ def _v2_assets(points_json: str, map_var: str, cluster_var: str) -> str:
           return markersByTopicId.size;
         }
 
-        function waitForMarkers(tries, onDone) {
-          const attached = bindAvailableMarkers();
-          if (attached >= sorted.length || tries <= 0) {
-            if (typeof onDone === "function") {
-              onDone();
-            }
-            return;
+        // Folium emits the marker scripts after this block; they have all run by DOMContentLoaded.
+        function bindMarkersWhenReady() {
+          if (markersByTopicId.size < sorted.length) {
+            bindAvailableMarkers();
           }
-          setTimeout(function() {
-            waitForMarkers(tries - 1, onDone);
-          }, 50);
         }
 
         if (!sorted.length) {
@@ -1106,9 +1122,8 @@ def _v2_assets(points_json: str, map_var: str, cluster_var: str) -> str:
           item.querySelector(".fishing-topic-count").textContent = point.posts_count;
           item.addEventListener("click", function() {
             openTopicView(point.topic_id, point.title);
-            waitForMarkers(80, function() {
-              focusTopic(point.topic_id);
-            });
+            bindMarkersWhenReady();
+            focusTopic(point.topic_id);
           });
           rowsByTopicId.set(String(point.topic_id), item);
           list.appendChild(item);
@@ -1119,12 +1134,15 @@ def _v2_assets(points_json: str, map_var: str, cluster_var: str) -> str:
           if (point) {
             openTopicView(point.topic_id, point.title);
           }
-          waitForMarkers(80, function() {
-            focusTopic(topicId);
-          });
+          bindMarkersWhenReady();
+          focusTopic(topicId);
         };
 
-        waitForMarkers(200);
+        if (document.readyState === "loading") {
+          document.addEventListener("DOMContentLoaded", bindMarkersWhenReady, { once: true });
+        } else {
+          bindMarkersWhenReady();
+        }
 
         toggleBtn.addEventListener("click", function() {
           sidebar.classList.toggle("collapsed");
@@ -1202,27 +1220,27 @@ def build_map_v2(topic_activity_rows: list[tuple[Topic, int, datetime | None]])
 
     fmap = folium.Map(location=center, zoom_start=6, control_scale=True, tiles="CartoDB positron")
     cluster = MarkerCluster(name="\u041a\u043b\u0430\u0441\u0442\u0435\u0440\u044b \u0432\u043e\u0434\u043e\u0451\u043c\u043e\u0432", show=True).add_to(fmap)
-    bounds: list[list[float]] = []
+    lats: list[float] = []
+    lons: list[float] = []
     heat_data: list[list[float]] = []
     sidebar_points: list[dict[str, str | int | float | None]] = []
+    now = datetime.now(UTC)
 
     for topic, posts_count, last_post_at in topic_activity_rows:
         if topic.geocoded_lat is None or topic.geocoded_lon is None:
             continue
         lat = float(topic.geocoded_lat)
         lon = float(topic.geocoded_lon)
-        color = _activity_color(last_post_at)
+        color = _activity_color(last_post_at, now)
         radius = _activity_radius(posts_count)
         diameter = radius * 2
         last_post_str = last_post_at.strftime("%d.%m.%Y %H:%M UTC") if last_post_at else "-"
 
-        popup_html = (
-            "<div style='min-width:220px'>"
-            f"<b>{html.escape(topic.title)}</b><br/>"
-            f"\u041f\u043e\u0441\u0442\u043e\u0432: {posts_count}<br/>"
-            f"\u041f\u043e\u0441\u043b\u0435\u0434\u043d\u0438\u0439 \u043f\u043e\u0441\u0442: {html.escape(last_post_str)}<br/>"
-            f"<a href='{html.escape(topic.url)}' target='_blank' rel='noopener noreferrer'>\u041e\u0442\u043a\u0440\u044b\u0442\u044c \u0442\u043e\u043f\u0438\u043a</a>"
-            "</div>"
+        popup_html = _V2_POPUP_TEMPLATE.format(
+            title=html.escape(topic.title),
+            posts_count=posts_count,
+            last_post=html.escape(last_post_str),
+            url=html.escape(topic.url),
         )
         marker = folium.Marker(
             location=[lat, lon],
@@ -1232,18 +1250,14 @@ def build_map_v2(topic_activity_rows: list[tuple[Topic, int, datetime | None]])
                 icon_size=(diameter, diameter),
                 icon_anchor=(radius, radius),
                 popup_anchor=(0, -radius),
-                html=(
-                    "<div "
-                    f"style='width:{diameter}px;height:{diameter}px;border-radius:50%;"
-                    f"background:{color};border:2px solid #fff;box-shadow:0 2px 10px rgba(0,0,0,.35);opacity:.92;'>"
-                    "</div>"
-                ),
+                html=_activity_icon_html(diameter, color),
             ),
         )
         marker.add_child(folium.Popup(popup_html, max_width=360))
         marker.add_to(cluster)
 
-        bounds.append([lat, lon])
+        lats.append(lat)
+        lons.append(lon)
         heat_weight = min(1.0, 0.3 + min(posts_count, 40) / 40)
         heat_data.append([lat, lon, heat_weight])
         sidebar_points.append(
@@ -1268,8 +1282,9 @@ def build_map_v2(topic_activity_rows: list[tuple[Topic, int, datetime | None]])
             max_zoom=11,
         ).add_to(fmap)
     folium.LayerControl(collapsed=False).add_to(fmap)
-    if bounds:
-        fmap.fit_bounds(bounds, padding=(30, 30))
+    if lats:
+        # Leaflet only needs the two corners; passing every point inflates the page by O(markers).
+        fmap.fit_bounds([[min(lats), min(lons)], [max(lats), max(lons)]], padding=(30, 30))
 
     points_json = json.dumps(sidebar_points, ensure_ascii=False).replace("</", "<\\/")
     fmap.get_root().html.add_child(Element(_v2_assets(points_json, fmap.get_name(), cluster.get_name())))
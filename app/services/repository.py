@@ -1,9 +1,40 @@
-from datetime import UTC, datetime
-
-from sqlalchemy import Select, and_, exists, func, or_, select
-from sqlalchemy.orm import Session, joinedload
-
-from app.models import Post, PostAttachment, Source, Topic
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import (
+    Select,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    lambda_stmt,
+    literal,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
+
+from app.models import GeocodeCache, Post, PostAttachment, Source, Topic, TopicMapStats
+from app.services.forum_scraper import ScrapedPost, ScrapedTopic
+
+
+def _posted_since(since: datetime):
+    # A closed range gives the planner a bounded estimate for the posted_at_utc index scan.
+    return Post.posted_at_utc.between(since, datetime.now(UTC) + timedelta(days=1))
+
+
+MAP_STATS_WINDOWS = {"24h": timedelta(hours=24), "7d": timedelta(days=7), "30d": timedelta(days=30)}
+MAP_STATS_COLUMNS = {
+    "24h": TopicMapStats.posts_24h,
+    "7d": TopicMapStats.posts_7d,
+    "30d": TopicMapStats.posts_30d,
+    "all": TopicMapStats.posts_total,
+}
 
 
 def get_or_create_source(db: Session, name: str, base_url: str) -> Source:
@@ -16,96 +47,146 @@ def get_or_create_source(db: Session, name: str, base_url: str) -> Source:
     return source
 
 
-def upsert_topic(db: Session, source_id: int, external_id: str, title: str, url: str, place_name: str) -> Topic:
-    topic = db.execute(select(Topic).where(and_(Topic.source_id == source_id, Topic.external_id == external_id))).scalar_one_or_none()
-    now = datetime.now(UTC)
-    if topic:
-        topic.title = title
-        topic.url = url
-        topic.place_name = place_name
-        topic.last_seen_at = now
-        db.flush()
-        return topic
-    topic = Topic(
-        source_id=source_id,
-        external_id=external_id,
-        title=title,
-        url=url,
-        place_name=place_name,
-        last_seen_at=now,
-    )
-    db.add(topic)
-    db.flush()
-    return topic
+UPSERT_BATCH_SIZE = 500
 
 
-def upsert_post(
-    db: Session,
-    topic_id: int,
-    external_id: str,
-    author: str,
-    posted_at_utc: datetime,
-    content_text: str,
-    url: str,
-) -> Post:
-    post = db.execute(select(Post).where(and_(Post.topic_id == topic_id, Post.external_id == external_id))).scalar_one_or_none()
-    if post:
-        post.author = author
-        post.posted_at_utc = posted_at_utc
-        post.content_text = content_text
-        post.url = url
-        db.flush()
-        return post
-    post = Post(
-        topic_id=topic_id,
-        external_id=external_id,
-        author=author,
-        posted_at_utc=posted_at_utc,
-        content_text=content_text,
-        url=url,
-    )
-    db.add(post)
-    db.flush()
-    return post
+def _insert_for(db: Session, model):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return pg_insert(model)
 
 
-def upsert_post_attachment(
-    db: Session,
-    post_id: int,
-    source_url: str,
-    file_name: str,
-    is_image: bool,
-    local_rel_path: str | None = None,
-    mime_type: str | None = None,
-    size_bytes: int | None = None,
-) -> PostAttachment:
-    attachment = db.execute(
-        select(PostAttachment).where(and_(PostAttachment.post_id == post_id, PostAttachment.source_url == source_url))
+def upsert_topics(db: Session, source_id: int, topics: Iterable[ScrapedTopic]) -> dict[str, Topic]:
+    """Insert or update scraped topics in batches and return them keyed by external_id."""
+    now = datetime.now(UTC)
+    rows_by_external_id = {
+        t.external_id: {
+            "source_id": source_id,
+            "external_id": t.external_id,
+            "title": t.title,
+            "url": t.url,
+            "place_name": t.place_name,
+            "last_seen_at": now,
+        }
+        for t in topics
+    }
+    rows = list(rows_by_external_id.values())
+    for offset in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = _insert_for(db, Topic).values(rows[offset : offset + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["source_id", "external_id"],
+            set_={name: stmt.excluded[name] for name in ("title", "url", "place_name", "last_seen_at")},
+        )
+        db.execute(stmt)
+
+    loaded: dict[str, Topic] = {}
+    external_ids = list(rows_by_external_id)
+    for offset in range(0, len(external_ids), UPSERT_BATCH_SIZE):
+        batch = external_ids[offset : offset + UPSERT_BATCH_SIZE]
+        for topic in db.execute(
+            select(Topic)
+            .where(Topic.source_id == source_id, Topic.external_id.in_(batch))
+            .execution_options(populate_existing=True)
+        ).scalars():
+            loaded[topic.external_id] = topic
+    return loaded
+
+
+def upsert_posts(db: Session, topic_id: int, posts: Iterable[ScrapedPost]) -> dict[str, int]:
+    """Insert or update scraped posts in batches and return their ids by external_id."""
+    rows_by_external_id = {
+        p.external_id: {
+            "topic_id": topic_id,
+            "external_id": p.external_id,
+            "author": p.author,
+            "posted_at_utc": p.posted_at_utc,
+            "content_text": p.content_text,
+            "url": p.url,
+        }
+        for p in posts
+    }
+    rows = list(rows_by_external_id.values())
+    for offset in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = _insert_for(db, Post).values(rows[offset : offset + UPSERT_BATCH_SIZE])
+        changed_columns = ("author", "posted_at_utc", "content_text", "url")
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["topic_id", "external_id"],
+            set_={**{name: stmt.excluded[name] for name in changed_columns}, "updated_at": func.now()},
+            # Re-scraped posts are mostly unchanged; skip rewriting identical rows.
+            where=or_(*(Post.__table__.c[name].is_distinct_from(stmt.excluded[name]) for name in changed_columns)),
+        )
+        db.execute(stmt)
+
+    ids: dict[str, int] = {}
+    external_ids = list(rows_by_external_id)
+    for offset in range(0, len(external_ids), UPSERT_BATCH_SIZE):
+        batch = external_ids[offset : offset + UPSERT_BATCH_SIZE]
+        ids.update(
+            db.execute(
+                select(Post.external_id, Post.id).where(Post.topic_id == topic_id, Post.external_id.in_(batch))
+            ).tuples().all()
+        )
+    return ids
+
+
+def upsert_post_attachments(
+    db: Session, post_ids: dict[str, int], posts: Iterable[ScrapedPost]
+) -> dict[tuple[int, str], PostAttachment]:
+    """Insert or update scraped attachments in batches and return them keyed by (post_id, source_url)."""
+    rows_by_key = {}
+    for p in posts:
+        post_id = post_ids[p.external_id]
+        for a in p.attachments:
+            row = rows_by_key.setdefault(
+                (post_id, a.source_url),
+                {"post_id": post_id, "source_url": a.source_url, "file_name": a.file_name, "is_image": a.is_image},
+            )
+            row["file_name"] = a.file_name
+            row["is_image"] = row["is_image"] or a.is_image
+    rows = list(rows_by_key.values())
+    table = PostAttachment.__table__
+    for offset in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = _insert_for(db, PostAttachment).values(rows[offset : offset + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["post_id", "source_url"],
+            # Once recognised as an image, an attachment stays one.
+            set_={"file_name": stmt.excluded.file_name, "is_image": or_(table.c.is_image, stmt.excluded.is_image)},
+            where=or_(
+                table.c.file_name.is_distinct_from(stmt.excluded.file_name),
+                and_(table.c.is_image.is_(False), stmt.excluded.is_image.is_(True)),
+            ),
+        )
+        db.execute(stmt)
+
+    loaded: dict[tuple[int, str], PostAttachment] = {}
+    attachment_post_ids = sorted({post_id for post_id, _ in rows_by_key})
+    for offset in range(0, len(attachment_post_ids), UPSERT_BATCH_SIZE):
+        batch = attachment_post_ids[offset : offset + UPSERT_BATCH_SIZE]
+        for attachment in db.execute(
+            select(PostAttachment)
+            .where(PostAttachment.post_id.in_(batch))
+            .execution_options(populate_existing=True)
+        ).scalars():
+            key = (attachment.post_id, attachment.source_url)
+            if key in rows_by_key:
+                loaded[key] = attachment
+    return loaded
+
+
+def get_cached_geocode(db: Session, place_key: str, provider: str, fresh_since: datetime) -> GeocodeCache | None:
+    return db.execute(
+        select(GeocodeCache).where(
+            GeocodeCache.place_key == place_key,
+            GeocodeCache.provider == provider,
+            GeocodeCache.fetched_at >= fresh_since,
+        )
     ).scalar_one_or_none()
-    if attachment:
-        attachment.file_name = file_name
-        attachment.is_image = attachment.is_image or is_image
-        if local_rel_path is not None:
-            attachment.local_rel_path = local_rel_path
-        if mime_type is not None:
-            attachment.mime_type = mime_type
-        if size_bytes is not None:
-            attachment.size_bytes = size_bytes
-        db.flush()
-        return attachment
-
-    attachment = PostAttachment(
-        post_id=post_id,
-        source_url=source_url,
-        file_name=file_name,
-        is_image=is_image,
-        local_rel_path=local_rel_path,
-        mime_type=mime_type,
-        size_bytes=size_bytes,
-    )
-    db.add(attachment)
-    db.flush()
-    return attachment
+
+
+def save_cached_geocode(db: Session, place_key: str, provider: str, lat: float, lon: float, confidence: float) -> None:
+    values = {"lat": lat, "lon": lon, "confidence": confidence, "fetched_at": datetime.now(UTC)}
+    stmt = _insert_for(db, GeocodeCache).values(place_key=place_key, provider=provider, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=["place_key", "provider"], set_=values))
 
 
 def list_attachments(
@@ -114,14 +195,18 @@ def list_attachments(
     only_missing: bool = False,
     limit: int = 200,
     offset: int = 0,
+    before: tuple[datetime, int] | None = None,
 ):
+    """List attachments newest post first; pass the last row's (posted_at_utc, id) as `before` for the next page."""
     stmt: Select = (
         select(PostAttachment)
         .join(PostAttachment.post)
         .join(Post.topic)
-        .options(joinedload(PostAttachment.post).joinedload(Post.topic))
-        .order_by(Post.posted_at_utc.desc())
+        .options(contains_eager(PostAttachment.post).contains_eager(Post.topic))
+        .order_by(Post.posted_at_utc.desc(), PostAttachment.id.desc())
     )
+    if before is not None:
+        stmt = stmt.where(tuple_(Post.posted_at_utc, PostAttachment.id) < tuple_(*before))
     if only_missing:
         stmt = stmt.where(PostAttachment.local_rel_path.is_(None), PostAttachment.is_image.is_(True))
     if q:
@@ -154,16 +239,25 @@ def list_posts(
     q: str | None = None,
     limit: int = 100,
     offset: int = 0,
+    before: tuple[datetime, int] | None = None,
 ):
-    stmt: Select = select(Post).join(Post.topic).options(joinedload(Post.topic)).order_by(Post.posted_at_utc.desc())
+    stmt: Select = (
+        select(Post)
+        .join(Post.topic)
+        .options(contains_eager(Post.topic))
+        .order_by(Post.posted_at_utc.desc(), Post.id.desc())
+    )
     conditions = []
+    if before:
+        # Keyset pagination: continue strictly after the last (posted_at_utc, id) already shown.
+        conditions.append(tuple_(Post.posted_at_utc, Post.id) < tuple_(*before))
     if since:
-        conditions.append(Post.posted_at_utc >= since)
+        conditions.append(_posted_since(since))
     if has_geo:
         conditions.append(Topic.geocoded_lat.is_not(None))
         conditions.append(Topic.geocoded_lon.is_not(None))
     if not include_deleted:
-        conditions.append(Post.is_deleted.is_(False))
+        conditions.append(Post.deleted_at.is_(None))
     if q:
         like = f"%{q}%"
         conditions.append(or_(Post.content_text.ilike(like), Post.author.ilike(like), Topic.title.ilike(like)))
@@ -212,8 +306,8 @@ def soft_delete_post(db: Session, post_id: int) -> bool:
     post = get_post(db, post_id)
     if not post:
         return False
-    post.is_deleted = True
-    post.deleted_at = datetime.now(UTC)
+    if post.deleted_at is None:
+        post.deleted_at = datetime.now(UTC)
     db.flush()
     return True
 
@@ -222,24 +316,45 @@ def restore_post(db: Session, post_id: int) -> bool:
     post = get_post(db, post_id)
     if not post:
         return False
-    post.is_deleted = False
     post.deleted_at = None
     db.flush()
     return True
 
 
+def soft_delete_posts(db: Session, post_ids: list[int]) -> int:
+    if not post_ids:
+        return 0
+    result = db.execute(
+        update(Post)
+        .where(Post.id.in_(post_ids), Post.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(UTC))
+    )
+    return result.rowcount
+
+
+def restore_posts(db: Session, post_ids: list[int]) -> int:
+    if not post_ids:
+        return 0
+    result = db.execute(
+        update(Post)
+        .where(Post.id.in_(post_ids), Post.deleted_at.is_not(None))
+        .values(deleted_at=None)
+    )
+    return result.rowcount
+
+
 def posts_for_map(db: Session, since: datetime | None, q: str | None, limit: int, min_geo_confidence: float):
     stmt = (
         select(Post)
         .join(Post.topic)
-        .options(joinedload(Post.topic))
-        .where(Post.is_deleted.is_(False))
+        .options(contains_eager(Post.topic))
+        .where(Post.deleted_at.is_(None))
         .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
         .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
         .order_by(Post.posted_at_utc.desc())
     )
     if since:
-        stmt = stmt.where(Post.posted_at_utc >= since)
+        stmt = stmt.where(_posted_since(since))
     if q:
         like = f"%{q}%"
         stmt = stmt.where(or_(Post.content_text.ilike(like), Post.author.ilike(like), Topic.title.ilike(like)))
@@ -253,15 +368,16 @@ def topics_for_map(
     limit: int,
     min_geo_confidence: float,
 ):
-    post_exists_stmt = select(Post.id).where(Post.topic_id == Topic.id, Post.is_deleted.is_(False))
+    post_exists_stmt = select(Post.id).where(Post.topic_id == Topic.id, Post.deleted_at.is_(None))
     if since:
-        post_exists_stmt = post_exists_stmt.where(Post.posted_at_utc >= since)
+        post_exists_stmt = post_exists_stmt.where(_posted_since(since))
     if q:
         like = f"%{q}%"
         post_exists_stmt = post_exists_stmt.where(or_(Post.content_text.ilike(like), Post.author.ilike(like)))
 
+    # build_map only reads these scalars; plain rows skip ORM hydration and identity-map bookkeeping.
     topic_stmt: Select = (
-        select(Topic)
+        select(Topic.id, Topic.title, Topic.url, Topic.place_name, Topic.geocoded_lat, Topic.geocoded_lon)
         .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
         .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
         .where(exists(post_exists_stmt))
@@ -270,7 +386,7 @@ def topics_for_map(
     if q:
         like = f"%{q}%"
         topic_stmt = topic_stmt.where(or_(Topic.title.ilike(like), Topic.place_name.ilike(like)))
-    return db.execute(topic_stmt.limit(limit)).scalars().all()
+    return db.execute(topic_stmt.limit(limit)).all()
 
 
 def topic_posts_paginated(
@@ -282,20 +398,31 @@ def topic_posts_paginated(
 ):
     base_stmt: Select = select(Post).where(Post.topic_id == topic_id)
     if not include_deleted:
-        base_stmt = base_stmt.where(Post.is_deleted.is_(False))
+        base_stmt = base_stmt.where(Post.deleted_at.is_(None))
 
-    total = db.execute(select(func.count()).select_from(base_stmt.subquery())).scalar_one()
     page = max(1, page)
     per_page = max(1, min(per_page, 100))
     offset = (page - 1) * per_page
-    items_stmt = (
-        base_stmt.options(joinedload(Post.attachments))
+    # The messages panel hits this on every open; lambda statements skip rebuilding the
+    # query and its cache key, leaving only parameter extraction per call.
+    # COUNT(*) OVER () returns the total alongside the page in one round trip.
+    items_stmt = lambda_stmt(
+        lambda: select(Post, func.count().over().label("total")).where(Post.topic_id == topic_id)
+    )
+    if not include_deleted:
+        items_stmt += lambda s: s.where(Post.deleted_at.is_(None))
+    items_stmt += (
+        lambda s: s.options(selectinload(Post.attachments))
         .order_by(Post.posted_at_utc.desc())
         .offset(offset)
         .limit(per_page)
     )
-    items = db.execute(items_stmt).scalars().unique().all()
-    return items, total
+    rows = db.execute(items_stmt).all()
+    if rows:
+        return [row[0] for row in rows], rows[0].total
+    # A page past the end carries no window total; only then count separately.
+    total = 0 if offset == 0 else db.execute(select(func.count()).select_from(base_stmt.subquery())).scalar_one()
+    return [], total
 
 
 def count_posts_for_map(
@@ -307,12 +434,12 @@ def count_posts_for_map(
     stmt: Select = (
         select(func.count(Post.id))
         .join(Post.topic)
-        .where(Post.is_deleted.is_(False))
+        .where(Post.deleted_at.is_(None))
         .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
         .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
     )
     if since:
-        stmt = stmt.where(Post.posted_at_utc >= since)
+        stmt = stmt.where(_posted_since(since))
     if q:
         like = f"%{q}%"
         stmt = stmt.where(or_(Post.content_text.ilike(like), Post.author.ilike(like), Topic.title.ilike(like)))
@@ -333,12 +460,12 @@ def topic_activity_for_map(
             func.max(Post.posted_at_utc).label("last_post_at"),
         )
         .join(Post, Post.topic_id == Topic.id)
-        .where(Post.is_deleted.is_(False))
+        .where(Post.deleted_at.is_(None))
         .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
         .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
     )
     if since:
-        stmt = stmt.where(Post.posted_at_utc >= since)
+        stmt = stmt.where(_posted_since(since))
     if q:
         like = f"%{q}%"
         stmt = stmt.where(
@@ -355,3 +482,75 @@ def topic_activity_for_map(
         .limit(limit)
     )
     return db.execute(stmt).all()
+
+
+def refresh_topic_map_stats(db: Session) -> None:
+    """Rebuild topic_map_stats from active posts; readers keep the old snapshot until commit."""
+    now = datetime.now(UTC)
+    upper = now + timedelta(days=1)
+    window_counts = [
+        func.count(Post.id).filter(Post.posted_at_utc.between(now - window, upper)) for window in MAP_STATS_WINDOWS.values()
+    ]
+    stats_stmt = (
+        select(Post.topic_id, *window_counts, func.count(Post.id), func.max(Post.posted_at_utc), literal(now))
+        .where(Post.deleted_at.is_(None))
+        .group_by(Post.topic_id)
+    )
+    db.execute(delete(TopicMapStats))
+    db.execute(
+        insert(TopicMapStats).from_select(
+            ["topic_id", "posts_24h", "posts_7d", "posts_30d", "posts_total", "last_post_at", "refreshed_at"],
+            stats_stmt,
+        )
+    )
+
+
+def map_stats_fresh(db: Session, max_age: timedelta, changed_since: datetime | None = None) -> bool:
+    """Whether topic_map_stats is younger than max_age and was rebuilt after changed_since."""
+    refreshed_at = db.execute(select(func.max(TopicMapStats.refreshed_at))).scalar_one_or_none()
+    if refreshed_at is None:
+        return False
+    if refreshed_at.tzinfo is None:
+        refreshed_at = refreshed_at.replace(tzinfo=UTC)
+    if changed_since is not None and refreshed_at < changed_since:
+        return False
+    return refreshed_at >= datetime.now(UTC) - max_age
+
+
+def topic_stats_for_map(db: Session, period: str, limit: int, min_geo_confidence: float):
+    """Same rows as topic_activity_for_map without a search query, read from topic_map_stats."""
+    posts_count = MAP_STATS_COLUMNS[period]
+    stmt = (
+        select(Topic, posts_count.label("posts_count"), TopicMapStats.last_post_at.label("last_post_at"))
+        .join(TopicMapStats, TopicMapStats.topic_id == Topic.id)
+        .where(posts_count > 0)
+        .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
+        .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
+        .order_by(TopicMapStats.last_post_at.desc())
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def topic_points_from_stats(db: Session, period: str, limit: int, min_geo_confidence: float):
+    """Same rows as topics_for_map without a search query; the stats join replaces the per-topic EXISTS."""
+    stmt = (
+        select(Topic.id, Topic.title, Topic.url, Topic.place_name, Topic.geocoded_lat, Topic.geocoded_lon)
+        .join(TopicMapStats, TopicMapStats.topic_id == Topic.id)
+        .where(MAP_STATS_COLUMNS[period] > 0)
+        .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
+        .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
+        .order_by(Topic.last_seen_at.desc())
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def count_stats_posts_for_map(db: Session, period: str, min_geo_confidence: float) -> int:
+    stmt = (
+        select(func.coalesce(func.sum(MAP_STATS_COLUMNS[period]), 0))
+        .join(Topic, TopicMapStats.topic_id == Topic.id)
+        .where(Topic.geocoded_lat.is_not(None), Topic.geocoded_lon.is_not(None))
+        .where(func.coalesce(Topic.geocode_confidence, 0.0) >= min_geo_confidence)
+    )
+    return int(db.execute(stmt).scalar_one())
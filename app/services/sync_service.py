@@ -1,28 +1,41 @@
+import asyncio
 import logging
 import re
+import stat
+import time
+import weakref
+from collections import deque
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import urlparse
 
 import httpx
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models import Post, PostAttachment, Topic
+from app.models import Post, PostAttachment, Source, Topic
 from app.services.forum_auth import ForumAuthService
-from app.services.forum_scraper import ForumScraper
+from app.services.forum_scraper import ForumScraper, ScrapedPost, ScrapedTopic
 from app.services.geocoding import GeocodingService, GoogleGeocoder, YandexGeocoder
 from app.services.repository import (
     attachments_for_post,
     get_or_create_source,
-    upsert_post,
-    upsert_post_attachment,
-    upsert_topic,
+    upsert_posts,
+    upsert_post_attachments,
+    upsert_topics,
 )
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+AUTH_BROKEN_COOLDOWN_SECONDS = 300
+SYNC_COMMIT_TOPICS = 20
+SYNC_COMMIT_SECONDS = 5.0
+# \w matches exactly the characters str.isalnum() accepts, plus "_".
+_UNSAFE_FILE_NAME_CHARS_RE = re.compile(r"[^\w.\- ]")
+
 
 class SyncService:
     def __init__(self):
@@ -55,24 +68,59 @@ class SyncService:
             if settings.geocoder_provider.lower() == "google"
             else YandexGeocoder(settings.yandex_geocoder_api_key, timeout=settings.http_timeout_seconds)
         )
-        self.geocoding = GeocodingService(provider)
+        self.geocoding = GeocodingService(
+            provider,
+            cache_ttl_days=settings.geocode_ttl_days,
+            concurrency=settings.geocode_concurrency,
+            requests_per_second=settings.geocode_requests_per_second,
+        )
+        self.geocode_ttl = timedelta(days=settings.geocode_ttl_days)
         self.attachments_dir = Path(settings.attachments_dir)
         self.attachments_dir.mkdir(parents=True, exist_ok=True)
-
-    async def _ensure_forum_cookie(self, force_refresh: bool = False) -> str:
-        cookie = await self.auth.ensure_cookie(force_refresh=force_refresh)
-        self.scraper.set_forum_session_cookie(cookie)
+        self._attachment_client: httpx.AsyncClient | None = None
+        self._download_semaphore = asyncio.Semaphore(max(1, settings.max_concurrency))
+        self._auth_broken_until: float = 0.0
+        self._run_lock = asyncio.Lock()
+        self._post_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def _post_lock(self, post_id: int) -> asyncio.Lock:
+        lock = self._post_locks.get(post_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._post_locks[post_id] = lock
+        return lock
+
+    def _attachment_http(self) -> httpx.AsyncClient:
+        # Attachments mostly live on the forum host; a pooled client keeps those connections warm.
+        if self._attachment_client is None or self._attachment_client.is_closed:
+            self._attachment_client = httpx.AsyncClient(
+                timeout=self.settings.http_timeout_seconds,
+                follow_redirects=True,
+                headers={"User-Agent": self.user_agent},
+                limits=httpx.Limits(
+                    max_keepalive_connections=self.settings.max_concurrency,
+                    max_connections=self.settings.max_concurrency * 2,
+                ),
+            )
+        return self._attachment_client
+
+    async def aclose(self) -> None:
+        # A scheduled sync may still be mid-run; let it finish before its clients go away.
+        async with self._run_lock:
+            if self._attachment_client is not None:
+                await self._attachment_client.aclose()
+                self._attachment_client = None
+            await self.geocoding.provider.aclose()
+
+    async def _ensure_forum_cookie(self, force_refresh: bool = False, stale_cookie: str | None = None) -> str:
+        cookie = await self.auth.ensure_cookie(force_refresh=force_refresh, stale_cookie=stale_cookie)
+        if cookie != self.scraper.forum_session_cookie:
+            self.scraper.set_forum_session_cookie(cookie)
         return cookie
 
     @staticmethod
     def _safe_file_name(file_name: str) -> str:
-        keep = []
-        for ch in file_name:
-            if ch.isalnum() or ch in {"-", "_", ".", " "}:
-                keep.append(ch)
-            else:
-                keep.append("_")
-        sanitized = "".join(keep).strip().replace(" ", "_")
+        sanitized = _UNSAFE_FILE_NAME_CHARS_RE.sub("_", file_name).strip().replace(" ", "_")
         return sanitized or "attachment.bin"
 
     @staticmethod
@@ -107,10 +155,29 @@ class SyncService:
         except Exception:
             return None
 
+    def _is_recorded_download(self, att: PostAttachment) -> bool:
+        # The row already points at a file for its current name (canonical or legacy layout),
+        # so an incremental sync can trust it without probing the filesystem.
+        if not att.local_rel_path or not att.size_bytes:
+            return False
+        return att.local_rel_path.startswith(f"{att.post_id}/") and att.local_rel_path.endswith(
+            f"_{self._safe_file_name(att.file_name)}"
+        )
+
+    @staticmethod
+    def _stored_size(path: Path) -> int:
+        """Size of a stored attachment file; 0 when it is missing, not a file, or empty."""
+        try:
+            st = path.stat()
+        except OSError:
+            return 0
+        return st.st_size if stat.S_ISREG(st.st_mode) else 0
+
     def _find_existing_attachment_rel_path(self, post_id: int, attachment_id: int, file_name: str) -> str | None:
         canonical_rel = self._canonical_attachment_rel_path(post_id, attachment_id, file_name)
         canonical_abs = self.attachments_dir / canonical_rel
-        if canonical_abs.exists():
+        # Empty files are leftovers of interrupted downloads from before the .part staging.
+        if self._stored_size(canonical_abs):
             return canonical_rel
 
         safe_name = self._safe_file_name(file_name)
@@ -121,7 +188,7 @@ class SyncService:
         # Legacy files used a sequence index prefix: "<post_id>/<idx>_<safe_name>".
         pattern = f"*_{safe_name}"
         for candidate in sorted(post_dir.glob(pattern)):
-            if candidate.is_file():
+            if self._stored_size(candidate):
                 return f"{post_id}/{candidate.name}"
         return None
 
@@ -191,23 +258,24 @@ class SyncService:
     async def _download_attachment(
         self, source_url: str, local_abs_path: Path
     ) -> tuple[str | None, int | None, str] | None:
+        if time.monotonic() < self._auth_broken_until:
+            return None
         cookie = await self._ensure_forum_cookie(force_refresh=False)
         if not cookie:
             return None
+        client = self._attachment_http()
         for attempt in range(2):
-            headers = {"User-Agent": self.user_agent, "Cookie": cookie}
             try:
-                async with httpx.AsyncClient(
-                    timeout=self.settings.http_timeout_seconds,
-                    follow_redirects=True,
-                    headers=headers,
-                ) as client:
-                    resp = await client.get(source_url)
+                # Attachments come from the forum host too, so they share the scraper's request budget.
+                await self.scraper.rate_limiter.acquire()
+                # An explicit Cookie header takes precedence over anything in the client's jar.
+                async with client.stream("GET", source_url, headers={"Cookie": cookie}) as resp:
                     if resp.status_code in {401, 403} or ForumAuthService.is_login_redirect_url(str(resp.url)):
                         if attempt == 0:
-                            cookie = await self._ensure_forum_cookie(force_refresh=True)
+                            cookie = await self._ensure_forum_cookie(force_refresh=True, stale_cookie=cookie)
                             if cookie:
                                 continue
+                        await resp.aread()
                         reason = self._auth_failure_reason(resp)
                         logger.warning(
                             "Attachment download unauthorized: %s (status=%s, final_url=%s, cookie_names=%s, reason=%s)",
@@ -217,36 +285,79 @@ class SyncService:
                             self._cookie_names(cookie),
                             reason,
                         )
+                        if resp.status_code == 401 or ForumAuthService.is_login_redirect_url(str(resp.url)):
+                            # Even a fresh login is rejected: stop paying two requests per attachment.
+                            self._auth_broken_until = time.monotonic() + AUTH_BROKEN_COOLDOWN_SECONDS
+                            logger.warning(
+                                "Forum session rejected after re-login; pausing attachment downloads for %ss",
+                                AUTH_BROKEN_COOLDOWN_SECONDS,
+                            )
                         return None
                     resp.raise_for_status()
-                    data = resp.content
-                    local_abs_path.parent.mkdir(parents=True, exist_ok=True)
-                    local_abs_path.write_bytes(data)
-                    return resp.headers.get("content-type"), len(data), str(resp.url)
+                    size_bytes = await self._stream_to_file(resp, local_abs_path)
+                    self._auth_broken_until = 0.0
+                    return resp.headers.get("content-type"), size_bytes, str(resp.url)
             except Exception as exc:
                 if attempt == 0:
-                    cookie = await self._ensure_forum_cookie(force_refresh=True)
+                    cookie = await self._ensure_forum_cookie(force_refresh=True, stale_cookie=cookie)
                     if cookie:
                         continue
                 logger.warning("Attachment download failed: %s (%s)", source_url, exc)
                 return None
         return None
 
+    @staticmethod
+    async def _stream_to_file(resp: httpx.Response, local_abs_path: Path) -> int:
+        # Write through a .part file so an interrupted download never looks like a stored attachment.
+        local_abs_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = local_abs_path.with_name(local_abs_path.name + ".part")
+        size_bytes = 0
+        try:
+            with part_path.open("wb") as fh:
+                async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    fh.write(chunk)
+                    size_bytes += len(chunk)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        part_path.replace(local_abs_path)
+        return size_bytes
+
+    async def _download_many(
+        self, jobs: list[tuple[str, Path]]
+    ) -> list[tuple[str | None, int | None, str] | None]:
+        """Download attachments concurrently, at most max_concurrency at a time; results keep job order."""
+
+        async def download(source_url: str, local_abs_path: Path):
+            async with self._download_semaphore:
+                return await self._download_attachment(source_url, local_abs_path)
+
+        results = await asyncio.gather(*(download(url, path) for url, path in jobs), return_exceptions=True)
+        for (source_url, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.warning("Attachment download failed: %s (%s)", source_url, result)
+        return [None if isinstance(result, Exception) else result for result in results]
+
     async def retry_post_attachments(self, db: Session, post: Post, force: bool = False) -> tuple[int, int]:
+        async with self._post_lock(post.id):
+            return await self._retry_post_attachments(db, post, force=force)
+
+    async def _retry_post_attachments(self, db: Session, post: Post, force: bool) -> tuple[int, int]:
         downloaded = 0
         total = 0
+        pending: list[tuple[PostAttachment, str, Path]] = []
         for att in attachments_for_post(db, post.id):
             total += 1
             if not att.is_image and self._looks_like_image(att.mime_type, att.file_name, att.source_url):
                 att.is_image = True
+            if not force and self._is_recorded_download(att):
+                continue
 
             existing_rel = self._find_existing_attachment_rel_path(post.id, att.id, att.file_name)
             if existing_rel and not force:
                 if att.local_rel_path != existing_rel:
                     att.local_rel_path = existing_rel
-                abs_existing = self.attachments_dir / existing_rel
-                if abs_existing.exists():
-                    att.size_bytes = abs_existing.stat().st_size
+                att.size_bytes = self._stored_size(self.attachments_dir / existing_rel)
                 if not att.is_image and self._looks_like_image(att.mime_type, att.file_name, att.source_url, existing_rel):
                     att.is_image = True
                 continue
@@ -256,8 +367,10 @@ class SyncService:
                 continue
 
             rel_path = self._canonical_attachment_rel_path(post.id, att.id, att.file_name)
-            abs_path = self.attachments_dir / rel_path
-            result = await self._download_attachment(att.source_url, abs_path)
+            pending.append((att, rel_path, self.attachments_dir / rel_path))
+
+        results = await self._download_many([(att.source_url, abs_path) for att, _, abs_path in pending])
+        for (att, rel_path, _), result in zip(pending, results):
             if result:
                 mime_type, size_bytes, final_url = result
                 att.local_rel_path = rel_path
@@ -361,13 +474,22 @@ class SyncService:
             )
         return scanned, deleted_files, detached_rows, reclassified_rows
 
-    def geocode_expired(self, topic: Topic) -> bool:
+    def geocode_cutoff(self) -> datetime:
+        return datetime.now(UTC) - self.geocode_ttl
+
+    def geocode_expired(self, topic: Topic, cutoff: datetime | None = None) -> bool:
         if topic.geocoded_lat is None or topic.geocoded_lon is None or topic.geocode_updated_at is None:
             return True
-        ttl = timedelta(days=self.settings.geocode_ttl_days)
-        return topic.geocode_updated_at < datetime.now(UTC) - ttl
+        return topic.geocode_updated_at < (cutoff or self.geocode_cutoff())
 
     async def run(self, db: Session):
+        if self._run_lock.locked():
+            logger.info("Forum sync is already running; skipping overlapping run")
+            return
+        async with self._run_lock:
+            await self._run(db)
+
+    async def _run(self, db: Session):
         await self._ensure_forum_cookie(force_refresh=False)
         source = get_or_create_source(db, self.settings.forum_source_name, self.settings.forum_root_url)
         scanned, deleted_files, detached_rows, reclassified_rows = self.cleanup_non_image_attachments(db, limit=1000)
@@ -380,91 +502,163 @@ class SyncService:
                 reclassified_rows,
             )
         db.commit()
+        async with self.scraper:
+            await self._sync_topics(db, source)
+
+    async def _sync_topics(self, db: Session, source: Source) -> None:
         topics = await self.scraper.fetch_topics()
         logger.info("Fetched %s topics", len(topics))
-        for scraped_topic in topics:
-            try:
-                topic = upsert_topic(
-                    db,
-                    source_id=source.id,
-                    external_id=scraped_topic.external_id,
-                    title=scraped_topic.title,
-                    url=scraped_topic.url,
-                    place_name=scraped_topic.place_name,
-                )
-                posts = await self.scraper.fetch_topic_posts(scraped_topic)
-                for p in posts:
-                    post = upsert_post(
-                        db,
-                        topic_id=topic.id,
-                        external_id=p.external_id,
-                        author=p.author,
-                        posted_at_utc=p.posted_at_utc,
-                        content_text=p.content_text,
-                        url=p.url,
-                    )
-                    for attachment in p.attachments:
-                        db_attachment = upsert_post_attachment(
-                            db,
-                            post_id=post.id,
-                            source_url=attachment.source_url,
-                            file_name=attachment.file_name,
-                            is_image=attachment.is_image,
-                        )
+        db_topics = upsert_topics(db, source.id, topics)
+        # Read what the loop needs now: each per-topic commit below expires the loaded objects.
+        topic_ids = {external_id: topic.id for external_id, topic in db_topics.items()}
+        cutoff = self.geocode_cutoff()
+        to_geocode = [
+            (topic.id, topic.place_name) for topic in db_topics.values() if self.geocode_expired(topic, cutoff)
+        ]
+        db.commit()
 
-                        if not db_attachment.is_image and self._looks_like_image(
-                            db_attachment.mime_type,
-                            db_attachment.file_name,
-                            db_attachment.source_url,
-                        ):
-                            db_attachment.is_image = True
-
-                        existing_rel = self._find_existing_attachment_rel_path(
-                            post_id=post.id,
-                            attachment_id=db_attachment.id,
-                            file_name=db_attachment.file_name,
-                        )
-                        if existing_rel:
-                            db_attachment.local_rel_path = existing_rel
-                            abs_existing = self.attachments_dir / existing_rel
-                            if abs_existing.exists():
-                                db_attachment.size_bytes = abs_existing.stat().st_size
-                            if not db_attachment.is_image and self._looks_like_image(
-                                db_attachment.mime_type,
-                                db_attachment.file_name,
-                                db_attachment.source_url,
-                                existing_rel,
-                            ):
-                                db_attachment.is_image = True
-                            continue
-
-                        rel_path = self._canonical_attachment_rel_path(post.id, db_attachment.id, db_attachment.file_name)
-                        abs_path = self.attachments_dir / rel_path
-                        if self.settings.download_attachments and db_attachment.is_image and not abs_path.exists():
-                            downloaded = await self._download_attachment(db_attachment.source_url, abs_path)
-                            if downloaded:
-                                mime_type, size_bytes, final_url = downloaded
-                                db_attachment.mime_type = mime_type
-                                db_attachment.size_bytes = size_bytes
-                                if not db_attachment.is_image and self._looks_like_image(
-                                    mime_type,
-                                    db_attachment.file_name,
-                                    db_attachment.source_url,
-                                    final_url,
-                                    rel_path,
-                                ):
-                                    db_attachment.is_image = True
-                        if abs_path.exists():
-                            db_attachment.local_rel_path = rel_path
-                if self.geocode_expired(topic):
-                    geo = await self.geocoding.geocode(topic.place_name)
-                    if geo:
-                        topic.geocoded_lat = geo.lat
-                        topic.geocoded_lon = geo.lon
-                        topic.geocode_provider = geo.provider
-                        topic.geocode_confidence = geo.confidence
-                        topic.geocode_updated_at = datetime.now(UTC)
-                db.commit()
-            except Exception:
-                db.rollback()
-                logger.exception("Failed processing topic %s", scraped_topic.url)
+        # Keep a few topic page fetches in flight while the current topic is written; the scraper's
+        # semaphore and rate limiter still bound the actual request rate. DB work stays on this task.
+        upcoming = iter(topics)
+        in_flight: deque[tuple[ScrapedTopic, asyncio.Task]] = deque()
+
+        def schedule_fetches() -> None:
+            while len(in_flight) < max(1, self.settings.max_concurrency):
+                scraped = next(upcoming, None)
+                if scraped is None:
+                    return
+                in_flight.append((scraped, asyncio.create_task(self.scraper.fetch_topic_posts(scraped))))
+
+        # Commit every few topics instead of after each one; a savepoint per topic still
+        # confines a failure to that topic's rows. Downloads wait until the batch is committed
+        # so no row locks are held across network transfers.
+        uncommitted = 0
+        pending_downloads: list[tuple[int, str, str, Path]] = []
+        last_commit = time.monotonic()
+        try:
+            schedule_fetches()
+            while in_flight:
+                scraped_topic, fetch = in_flight.popleft()
+                schedule_fetches()
+                try:
+                    posts = await fetch
+                    with db.begin_nested():
+                        downloads = self._store_topic_posts(db, topic_ids[scraped_topic.external_id], posts)
+                    pending_downloads.extend(downloads)
+                    uncommitted += 1
+                except Exception:
+                    logger.exception("Failed processing topic %s", scraped_topic.url)
+                if uncommitted and (
+                    uncommitted >= SYNC_COMMIT_TOPICS or time.monotonic() - last_commit >= SYNC_COMMIT_SECONDS
+                ):
+                    await self._finish_topic_batch(db, uncommitted, pending_downloads)
+                    uncommitted = 0
+                    pending_downloads = []
+                    last_commit = time.monotonic()
+        finally:
+            for _, fetch in in_flight:
+                fetch.cancel()
+            # Let the cancelled fetches unwind before the caller closes the scraper's client.
+            await asyncio.gather(*(fetch for _, fetch in in_flight), return_exceptions=True)
+        if uncommitted:
+            await self._finish_topic_batch(db, uncommitted, pending_downloads)
+        await self._geocode_topics(db, to_geocode)
+
+    async def _finish_topic_batch(
+        self, db: Session, count: int, downloads: list[tuple[int, str, str, Path]]
+    ) -> None:
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed committing %s synced topics", count)
+            return
+        if not downloads:
+            return
+
+        results = await self._download_many([(source_url, abs_path) for _, source_url, _, abs_path in downloads])
+        rows = [
+            {"id": attachment_id, "mime_type": result[0], "size_bytes": result[1], "local_rel_path": rel_path}
+            for (attachment_id, _, rel_path, _), result in zip(downloads, results)
+            if result
+        ]
+        if not rows:
+            return
+        try:
+            db.execute(update(PostAttachment), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed recording %s downloaded attachments", len(rows))
+
+    def _store_topic_posts(
+        self, db: Session, topic_id: int, posts: list[ScrapedPost]
+    ) -> list[tuple[int, str, str, Path]]:
+        """Upsert a topic's posts and attachments; returns (id, source_url, rel_path, abs_path) to download."""
+        post_ids = upsert_posts(db, topic_id, posts)
+        db_attachments = upsert_post_attachments(db, post_ids, posts)
+        downloads: list[tuple[int, str, str, Path]] = []
+        for (post_id, _), db_attachment in db_attachments.items():
+            if not db_attachment.is_image and self._looks_like_image(
+                db_attachment.mime_type,
+                db_attachment.file_name,
+                db_attachment.source_url,
+            ):
+                db_attachment.is_image = True
+            if self._is_recorded_download(db_attachment):
+                continue
+
+            existing_rel = self._find_existing_attachment_rel_path(
+                post_id=post_id,
+                attachment_id=db_attachment.id,
+                file_name=db_attachment.file_name,
+            )
+            if existing_rel:
+                db_attachment.local_rel_path = existing_rel
+                db_attachment.size_bytes = self._stored_size(self.attachments_dir / existing_rel)
+                if not db_attachment.is_image and self._looks_like_image(
+                    db_attachment.mime_type,
+                    db_attachment.file_name,
+                    db_attachment.source_url,
+                    existing_rel,
+                ):
+                    db_attachment.is_image = True
+                continue
+
+            # _find_existing_attachment_rel_path found no non-empty file, so the canonical path needs a download.
+            if self.settings.download_attachments and db_attachment.is_image:
+                rel_path = self._canonical_attachment_rel_path(post_id, db_attachment.id, db_attachment.file_name)
+                abs_path = self.attachments_dir / rel_path
+                downloads.append((db_attachment.id, db_attachment.source_url, rel_path, abs_path))
+        return downloads
+
+    async def _geocode_topics(self, db: Session, pending: list[tuple[int, str]]) -> None:
+        if not pending:
+            return
+        results = await self.geocoding.geocode_many([place_name for _, place_name in pending], db=db)
+        now = datetime.now(UTC)
+        rows = [
+            {
+                "id": topic_id,
+                "geocoded_lat": geo.lat,
+                "geocoded_lon": geo.lon,
+                "geocode_provider": geo.provider,
+                "geocode_confidence": geo.confidence,
+                "geocode_updated_at": now,
+            }
+            for (topic_id, _), geo in zip(pending, results)
+            if geo
+        ]
+        if not rows:
+            return
+        try:
+            db.execute(update(Topic), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed saving geocodes for %s topics", len(rows))
+
+
+@lru_cache
+def get_sync_service() -> SyncService:
+    return SyncService()
@@ -0,0 +1,14 @@
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+from app.config import get_settings
+
+settings = get_settings()
+
+_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("app/templates"),
+    autoescape=True,
+    auto_reload=settings.app_env == "dev",
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
+)
+templates = Jinja2Templates(env=_env)
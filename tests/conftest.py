@@ -1,19 +1,38 @@
 from datetime import UTC, datetime
 
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 
 from app.database import Base
 from app.models import Post, Source, Topic
 
 
-@pytest.fixture()
-def db_session() -> Session:
-    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
-    testing_session_local = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session, future=True)
+@pytest.fixture(scope="session")
+def db_engine():
+    # One in-memory schema for the whole run; each test works inside a transaction that is rolled back.
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True, poolclass=StaticPool)
+
+    # pysqlite manages transactions itself and breaks SAVEPOINTs; let SQLAlchemy emit BEGIN.
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
     Base.metadata.create_all(bind=engine)
-    session = testing_session_local()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def db_session(db_engine) -> Session:
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
 
     source = Source(name="test", base_url="https://example.com")
     session.add(source)
@@ -46,3 +65,5 @@ def db_session() -> Session:
     session.commit()
     yield session
     session.close()
+    transaction.rollback()
+    connection.close()
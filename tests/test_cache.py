@@ -0,0 +1,42 @@
+from starlette.requests import Request
+
+from app.api import public
+from app.services.cache import TTLCache
+
+
+def _home(db_session, headers=()):
+    request = Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": list(headers), "session": {}})
+    return public.home(request, period="7d", q=None, limit=200, ui="legacy", db=db_session)
+
+
+def test_ttl_cache_get_set_and_evict():
+    cache = TTLCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_disabled_when_ttl_zero():
+    cache = TTLCache(ttl_seconds=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_home_answers_matching_etag_with_304(db_session, monkeypatch):
+    monkeypatch.setattr(public, "response_cache", TTLCache(ttl_seconds=60))
+
+    first = _home(db_session)
+    assert first.status_code == 200 and first.body
+    etag = first.headers["etag"]
+
+    revalidated = _home(db_session, [(b"if-none-match", etag.encode())])
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert not revalidated.body
+
+    assert _home(db_session, [(b"if-none-match", b'"stale"')]).status_code == 200
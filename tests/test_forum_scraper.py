@@ -0,0 +1,124 @@
+import httpx
+import pytest
+
+from app.services.forum_scraper import ForumScraper
+
+
+def _scraper() -> ForumScraper:
+    return ForumScraper(
+        forum_root_url="https://forum.example/forum/forums/ponds.63/",
+        max_forum_pages=1,
+        max_topic_pages=1,
+        timeout_seconds=5,
+        max_concurrency=2,
+        requests_per_second=100.0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_robots_fetched_once_and_applied():
+    robots_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal robots_requests
+        if request.url.path == "/robots.txt":
+            robots_requests += 1
+            return httpx.Response(200, text="User-agent: *\nDisallow: /forum/members/\n")
+        return httpx.Response(200, text="ok")
+
+    scraper = _scraper()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await scraper._allowed_by_robots(client, "https://forum.example/forum/threads/a.1/") is True
+        assert await scraper._allowed_by_robots(client, "https://forum.example/forum/members/x.2/") is False
+        assert await scraper._fetch(client, "https://forum.example/forum/members/x.2/") == ""
+    assert robots_requests == 1
+
+
+FORUM_PAGE = """
+<div class="structItem-title">
+  <a href="/forum/threads/pond-zelenyi.101/" data-tp-primary="on">Пруд  Зеленый</a>
+  <a href="/forum/threads/lake-lesnoe.102/unread">Озеро Лесное</a>
+  <a href="/forum/members/ivan.5/">Ivan</a>
+</div>
+"""
+
+TOPIC_PAGE = """
+<nav><a href="/forum/threads/pond-zelenyi.101/page-2">2</a></nav>
+<article class="message" id="js-post-9001" data-content="post-9001">
+  <a class="username" href="/forum/members/ivan.5/">Ivan</a>
+  <time datetime="2024-05-01T12:34:56+0300">1 May</time>
+  <a href="/forum/posts/9001/">#1</a>
+  <div class="bbWrapper">Клев   отличный
+    <a href="/forum/attachments/carp-jpg.77/">carp.jpg</a>
+    <img src="/forum/data/attachments/0/77-abc.jpg" />
+  </div>
+</article>
+"""
+
+
+@pytest.mark.asyncio
+async def test_fetch_topics_and_posts():
+    requested: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        requested.append(path)
+        if path == "/robots.txt":
+            return httpx.Response(404)
+        if path.startswith("/forum/forums/"):
+            return httpx.Response(200, text=FORUM_PAGE)
+        if path.startswith("/forum/threads/"):
+            return httpx.Response(200, text=TOPIC_PAGE)
+        return httpx.Response(404)
+
+    scraper = _scraper()
+    async with scraper:
+        await scraper._client.aclose()
+        scraper._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        topics = await scraper.fetch_topics()
+        assert [(t.external_id, t.title) for t in topics] == [("101", "Пруд Зеленый"), ("102", "Озеро Лесное")]
+        assert topics[1].url == "https://forum.example/forum/threads/lake-lesnoe.102/"
+
+        scraper.max_topic_pages = 2
+        posts = await scraper.fetch_topic_posts(topics[0])
+    # The first topic page is fetched once and reused for post parsing.
+    assert requested.count("/forum/threads/pond-zelenyi.101/") == 1
+    assert requested.count("/forum/threads/pond-zelenyi.101/page-2") == 1
+    assert len(posts) == 1
+    post = posts[0]
+    assert post.external_id == "9001"
+    assert post.author == "Ivan"
+    assert post.posted_at_utc.isoformat() == "2024-05-01T09:34:56+00:00"
+    assert post.url == "https://forum.example/forum/posts/9001/"
+    assert post.content_text == "Клев отличный carp.jpg"
+    assert [(a.file_name, a.is_image) for a in post.attachments] == [("carp.jpg", True), ("77-abc.jpg", True)]
+
+
+def test_parse_datetime_to_utc_formats():
+    parse = ForumScraper.parse_datetime_to_utc
+    assert parse("2024-05-01T12:34:56+0300").isoformat() == "2024-05-01T09:34:56+00:00"
+    assert parse("2024-05-01T12:34:56Z").isoformat() == "2024-05-01T12:34:56+00:00"
+    assert parse("2024-05-01T12:34:56").isoformat() == "2024-05-01T12:34:56+00:00"
+    assert parse("May 1, 2024 at 12:34 PM").isoformat() == "2024-05-01T12:34:00+00:00"
+
+
+@pytest.mark.asyncio
+async def test_fetch_retries_throttling_but_not_missing_pages():
+    requested: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        if request.url.path == "/robots.txt":
+            return httpx.Response(404)
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if requested.count("/busy") == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, text="ok")
+
+    scraper = _scraper()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await scraper._fetch(client, "https://forum.example/missing") == ""
+        assert await scraper._fetch(client, "https://forum.example/busy") == "ok"
+    assert requested.count("/missing") == 1
+    assert requested.count("/busy") == 2
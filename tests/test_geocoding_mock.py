@@ -1,6 +1,11 @@
+import time
+
 import pytest
 
+from app.models import GeocodeCache
+from app.services import geocoding
 from app.services.geocoding import BaseGeocoder, GeocodeResult, GeocodingService
+from app.services.repository import save_cached_geocode
 
 
 class FakeGeocoder(BaseGeocoder):
@@ -17,3 +22,80 @@ async def test_geocoding_service_mock():
     assert result is not None
     assert result.provider == "fake"
     assert result.lat == 10.0
+
+
+class CountingGeocoder(FakeGeocoder):
+    def __init__(self):
+        self.calls = 0
+
+    async def geocode(self, place_name: str):
+        self.calls += 1
+        return await super().geocode(place_name)
+
+
+@pytest.mark.asyncio
+async def test_geocoding_service_caches_by_normalized_place(db_session):
+    provider = CountingGeocoder()
+    service = GeocodingService(provider)
+    assert await service.geocode("Пруд  Рыбный", db=db_session) is not None
+    assert await service.geocode(" пруд рыбный ") is not None
+    assert provider.calls == 1
+
+    db_session.commit()
+    fresh_provider = CountingGeocoder()
+    result = await GeocodingService(fresh_provider).geocode("ПРУД РЫБНЫЙ", db=db_session)
+    assert fresh_provider.calls == 0
+    assert result is not None and result.lat == 10.0
+
+
+@pytest.mark.asyncio
+async def test_geocode_many_dedupes_places():
+    provider = CountingGeocoder()
+    results = await GeocodingService(provider).geocode_many(["Озеро", "озеро", "Река"])
+    assert [r.provider for r in results] == ["fake", "fake", "fake"]
+    assert provider.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_geocode_many_respects_provider_rate():
+    provider = CountingGeocoder()
+    service = GeocodingService(provider, requests_per_second=20)
+    started = time.monotonic()
+    await service.geocode_many(["Озеро", "Река", "Пруд"])
+    assert provider.calls == 3
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_geocode_cache_keeps_rows_per_provider(db_session):
+    class OtherGeocoder(CountingGeocoder):
+        provider_name = "other"
+
+    await GeocodingService(CountingGeocoder()).geocode("Озеро", db=db_session)
+    await GeocodingService(OtherGeocoder()).geocode("Озеро", db=db_session)
+    db_session.commit()
+
+    fresh_provider = CountingGeocoder()
+    assert await GeocodingService(fresh_provider).geocode("озеро", db=db_session) is not None
+    assert fresh_provider.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_cache_write_loses_only_its_own_row(db_session, monkeypatch):
+    def save_or_fail(db, place_key, provider, lat, lon, confidence):
+        if place_key == "река":
+            # A NOT NULL violation leaves the transaction needing a rollback, like a Postgres error would.
+            db.add(GeocodeCache(place_key=place_key, provider=provider))
+            db.flush()
+        save_cached_geocode(db, place_key, provider, lat, lon, confidence)
+
+    monkeypatch.setattr(geocoding, "save_cached_geocode", save_or_fail)
+    results = await GeocodingService(CountingGeocoder()).geocode_many(["Озеро", "Река", "Пруд"], db=db_session)
+    assert all(result is not None for result in results)
+    db_session.commit()
+
+    fresh_provider = CountingGeocoder()
+    fresh = GeocodingService(fresh_provider)
+    assert await fresh.geocode("озеро", db=db_session) is not None
+    assert await fresh.geocode("пруд", db=db_session) is not None
+    assert fresh_provider.calls == 0
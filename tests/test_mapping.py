@@ -1,4 +1,17 @@
-from app.services.repository import posts_for_map
+from datetime import UTC, datetime, timedelta
+
+from app.services.map_service import build_map, parse_period
+from app.services.repository import (
+    count_posts_for_map,
+    count_stats_posts_for_map,
+    map_stats_fresh,
+    posts_for_map,
+    refresh_topic_map_stats,
+    topic_activity_for_map,
+    topic_points_from_stats,
+    topic_stats_for_map,
+    topics_for_map,
+)
 
 
 def test_posts_use_topic_coordinates(db_session):
@@ -7,3 +20,38 @@ def test_posts_use_topic_coordinates(db_session):
     post = rows[0]
     assert post.topic.geocoded_lat == 55.7
     assert post.topic.geocoded_lon == 37.6
+
+
+def test_posts_for_map_since_window(db_session):
+    since = datetime.now(UTC) - timedelta(days=1)
+    rows = posts_for_map(db_session, since=since, q=None, limit=50, min_geo_confidence=0.4)
+    assert len(rows) == 1
+
+    future = datetime.now(UTC) + timedelta(days=2)
+    assert posts_for_map(db_session, since=future, q=None, limit=50, min_geo_confidence=0.4) == []
+
+
+def test_topic_map_stats_match_live_activity(db_session):
+    refresh_topic_map_stats(db_session)
+    db_session.commit()
+    assert map_stats_fresh(db_session, timedelta(minutes=1))
+    assert not map_stats_fresh(db_session, timedelta(minutes=1), changed_since=datetime.now(UTC) + timedelta(seconds=1))
+
+    for period in ("24h", "7d", "all"):
+        since = parse_period(period)
+        live = topic_activity_for_map(db_session, since=since, q=None, limit=10, min_geo_confidence=0.4)
+        stats = topic_stats_for_map(db_session, period=period, limit=10, min_geo_confidence=0.4)
+        assert [(t.id, n) for t, n, _ in stats] == [(t.id, n) for t, n, _ in live]
+        assert topic_points_from_stats(db_session, period=period, limit=10, min_geo_confidence=0.4) == topics_for_map(
+            db_session, since=since, q=None, limit=10, min_geo_confidence=0.4
+        )
+        assert count_stats_posts_for_map(db_session, period=period, min_geo_confidence=0.4) == count_posts_for_map(
+            db_session, since=since, q=None, min_geo_confidence=0.4
+        )
+
+
+def test_topics_for_map_returns_plain_rows(db_session):
+    rows = topics_for_map(db_session, since=None, q=None, limit=50, min_geo_confidence=0.4)
+    assert len(rows) == 1
+    assert (rows[0].geocoded_lat, rows[0].geocoded_lon) == (55.7, 37.6)
+    assert rows[0].title in build_map(rows)
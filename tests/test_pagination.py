@@ -0,0 +1,71 @@
+from datetime import UTC, datetime, timedelta
+
+from app.models import Post, PostAttachment
+from app.services.repository import list_attachments, list_posts, topic_posts_paginated
+
+
+def test_list_posts_keyset_pagination(db_session):
+    base = datetime.now(UTC) - timedelta(hours=1)
+    for idx in range(4):
+        db_session.add(
+            Post(
+                topic_id=1,
+                external_id=f"k{idx}",
+                author="Petr",
+                # Two posts share a timestamp to exercise the id tie-breaker.
+                posted_at_utc=base - timedelta(minutes=idx // 2),
+                content_text="keyset",
+                url=f"https://example.com/p/k{idx}",
+            )
+        )
+    db_session.commit()
+
+    expected = [p.id for p in list_posts(db_session, has_geo=False, limit=100)]
+    seen: list[int] = []
+    before = None
+    while True:
+        page = list_posts(db_session, has_geo=False, limit=2, before=before)
+        if not page:
+            break
+        seen.extend(p.id for p in page)
+        before = (page[-1].posted_at_utc, page[-1].id)
+    assert seen == expected
+    assert len(seen) == 5
+
+
+def test_topic_posts_paginated_returns_total_with_page(db_session):
+    for idx in range(3):
+        db_session.add(
+            Post(
+                topic_id=1,
+                external_id=f"w{idx}",
+                author="Petr",
+                posted_at_utc=datetime.now(UTC) - timedelta(days=idx + 1),
+                content_text="window",
+                url=f"https://example.com/p/w{idx}",
+            )
+        )
+    db_session.commit()
+
+    items, total = topic_posts_paginated(db_session, topic_id=1, page=2, per_page=3)
+    assert total == 4
+    assert [p.external_id for p in items] == ["w2"]
+
+    items, total = topic_posts_paginated(db_session, topic_id=1, page=5, per_page=3)
+    assert items == [] and total == 4
+
+
+def test_list_attachments_keyset_pagination(db_session):
+    for idx in range(5):
+        db_session.add(
+            PostAttachment(post_id=1, source_url=f"https://example.com/a/{idx}", file_name=f"{idx}.jpg", is_image=True)
+        )
+    db_session.commit()
+
+    seen: list[int] = []
+    before = None
+    while page := list_attachments(db_session, limit=2, before=before):
+        seen.extend(a.id for a in page)
+        before = (page[-1].post.posted_at_utc, page[-1].id)
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == 5
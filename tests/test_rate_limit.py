@@ -0,0 +1,15 @@
+import time
+
+import pytest
+
+from app.services.rate_limit import AsyncRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_acquisitions():
+    limiter = AsyncRateLimiter(rate=20.0)
+    started = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire()
+    # The first token is available immediately; the next three wait 1/20 s each.
+    assert time.monotonic() - started >= 0.14
@@ -0,0 +1,54 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import event
+
+from app.models import Post
+from app.services.repository import get_post, list_posts, topic_posts_paginated
+
+
+def _count_selects(db_session, fn):
+    statements: list[str] = []
+    engine = db_session.get_bind()
+
+    def _record(conn, cursor, statement, *args):
+        # The fixture's per-test SAVEPOINT bookkeeping is not part of the loading strategy.
+        if statement.startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    return len(statements)
+
+
+def test_post_read_paths_do_not_lazy_load_topics(db_session):
+    topic_id = db_session.get(Post, 1).topic_id
+    for idx in range(3):
+        db_session.add(
+            Post(
+                topic_id=topic_id,
+                external_id=f"n{idx}",
+                author="Petr",
+                posted_at_utc=datetime.now(UTC),
+                content_text="batch",
+                url=f"https://example.com/p/n{idx}",
+            )
+        )
+    db_session.commit()
+    db_session.expunge_all()
+
+    def serialize_list():
+        assert {post.topic.id for post in list_posts(db_session, has_geo=False)} == {topic_id}
+
+    def serialize_one():
+        assert get_post(db_session, 1).topic.id == topic_id
+
+    assert _count_selects(db_session, serialize_list) == 1
+    db_session.expunge_all()
+    assert _count_selects(db_session, serialize_one) == 1
+    db_session.expunge_all()
+    # The messages panel never touches post.topic, so the page query plus the
+    # attachments batch is all it should cost.
+    assert _count_selects(db_session, lambda: topic_posts_paginated(db_session, topic_id)) == 2
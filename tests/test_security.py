@@ -0,0 +1,13 @@
+from app.config import get_settings
+from app.security import verify_admin_credentials
+
+
+def test_verify_admin_credentials():
+    settings = get_settings()
+    assert verify_admin_credentials(settings.admin_user, settings.admin_password) is True
+    assert verify_admin_credentials(settings.admin_user, "wrong") is False
+    assert verify_admin_credentials("wrong", settings.admin_password) is False
+
+
+def test_verify_admin_credentials_non_ascii_input():
+    assert verify_admin_credentials("админ", "пароль") is False
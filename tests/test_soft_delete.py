@@ -1,4 +1,4 @@
-from app.services.repository import list_posts, restore_post, soft_delete_post
+from app.services.repository import list_posts, restore_post, restore_posts, soft_delete_post, soft_delete_posts
 
 
 def test_soft_delete_and_filter(db_session):
@@ -22,3 +22,17 @@ def test_soft_delete_and_filter(db_session):
     visible_after = list_posts(db_session, include_deleted=False, has_geo=False)
     assert len(visible_after) == 1
     assert visible_after[0].is_deleted is False
+
+
+def test_bulk_soft_delete_and_restore(db_session):
+    posts = list_posts(db_session, include_deleted=False, has_geo=False)
+    ids = [p.id for p in posts]
+
+    assert soft_delete_posts(db_session, ids) == len(ids)
+    db_session.commit()
+    assert list_posts(db_session, include_deleted=False, has_geo=False) == []
+    assert soft_delete_posts(db_session, ids) == 0
+
+    assert restore_posts(db_session, ids) == len(ids)
+    db_session.commit()
+    assert len(list_posts(db_session, include_deleted=False, has_geo=False)) == len(ids)
@@ -0,0 +1,286 @@
+import asyncio
+from datetime import UTC, datetime
+
+import httpx
+import pytest
+from sqlalchemy import event, select
+
+from app.models import Post, PostAttachment, Source, Topic
+from app.services.forum_scraper import ScrapedAttachment, ScrapedPost, ScrapedTopic
+from app.services.geocoding import GeocodeResult
+from app.services.sync_service import SyncService
+
+
+def _scraped_post(topic: ScrapedTopic, n: int) -> ScrapedPost:
+    return ScrapedPost(
+        topic_external_id=topic.external_id,
+        external_id=f"{topic.external_id}-{n}",
+        author="Ivan",
+        posted_at_utc=datetime.now(UTC),
+        content_text="text",
+        url=f"{topic.url}#post-{n}",
+        attachments=[ScrapedAttachment(f"{topic.url}/img{n}.jpg", f"img{n}.jpg", True)],
+    )
+
+
+@pytest.mark.asyncio
+async def test_sync_topics_downloads_attachments_concurrently(db_session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    service = SyncService()
+    topics = [ScrapedTopic(str(i), f"Topic {i}", f"https://example.com/t/{i}", f"Place {i}") for i in range(10, 14)]
+    active = 0
+    peak = 0
+
+    async def fetch_topics():
+        return topics
+
+    async def fetch_topic_posts(topic):
+        await asyncio.sleep(0)
+        return [_scraped_post(topic, n) for n in range(3)]
+
+    async def download(source_url, local_abs_path):
+        nonlocal active, peak
+        assert not db_session.in_transaction(), "downloads must not hold the sync transaction open"
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        local_abs_path.parent.mkdir(parents=True, exist_ok=True)
+        local_abs_path.write_bytes(b"img")
+        return "image/jpeg", 3, source_url
+
+    async def no_geocoding(db, pending):
+        return None
+
+    monkeypatch.setattr(service.scraper, "fetch_topics", fetch_topics)
+    monkeypatch.setattr(service.scraper, "fetch_topic_posts", fetch_topic_posts)
+    monkeypatch.setattr(service, "_download_attachment", download)
+    monkeypatch.setattr(service, "_geocode_topics", no_geocoding)
+
+    source = db_session.execute(select(Source)).scalar_one()
+    await service._sync_topics(db_session, source)
+
+    attachments = db_session.execute(select(PostAttachment)).scalars().all()
+    assert len(attachments) == 12
+    assert all(att.local_rel_path and att.size_bytes == 3 for att in attachments)
+    assert 1 < peak <= service.settings.max_concurrency
+
+    probes = []
+    monkeypatch.setattr(service, "_find_existing_attachment_rel_path", lambda **kwargs: probes.append(kwargs))
+    monkeypatch.setattr(service, "_download_many", lambda jobs: probes.extend(jobs) or asyncio.sleep(0, []))
+    await service._sync_topics(db_session, source)
+    assert probes == []
+
+
+@pytest.mark.asyncio
+async def test_sync_topics_rolls_back_only_the_failing_topic(db_session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    service = SyncService()
+    topics = [ScrapedTopic(str(i), f"Topic {i}", f"https://example.com/t/{i}", f"Place {i}") for i in range(20, 23)]
+    store = service._store_topic_posts
+
+    async def fetch_topics():
+        return topics
+
+    async def fetch_topic_posts(topic):
+        return [_scraped_post(topic, 0)]
+
+    def store_or_fail(db, topic_id, posts):
+        downloads = store(db, topic_id, posts)
+        if posts[0].topic_external_id == "21":
+            raise RuntimeError("boom")
+        return downloads
+
+    async def no_download(jobs):
+        return [None] * len(jobs)
+
+    async def no_geocoding(db, pending):
+        return None
+
+    monkeypatch.setattr(service.scraper, "fetch_topics", fetch_topics)
+    monkeypatch.setattr(service.scraper, "fetch_topic_posts", fetch_topic_posts)
+    monkeypatch.setattr(service, "_store_topic_posts", store_or_fail)
+    monkeypatch.setattr(service, "_download_many", no_download)
+    monkeypatch.setattr(service, "_geocode_topics", no_geocoding)
+
+    source = db_session.execute(select(Source)).scalar_one()
+    await service._sync_topics(db_session, source)
+    db_session.rollback()
+
+    stored = set(db_session.execute(select(Post.external_id)).scalars())
+    assert {"20-0", "22-0"} <= stored
+    assert "21-0" not in stored
+
+
+@pytest.mark.asyncio
+async def test_sync_topics_waits_for_cancelled_prefetches(db_session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    service = SyncService()
+    topics = [ScrapedTopic(str(i), f"Topic {i}", f"https://example.com/t/{i}", f"Place {i}") for i in range(30, 34)]
+    fetches: list[asyncio.Task] = []
+
+    async def fetch_topics():
+        return topics
+
+    async def fetch_topic_posts(topic):
+        fetches.append(asyncio.current_task())
+        if topic.external_id != "30":
+            await asyncio.sleep(10)
+        return [_scraped_post(topic, 0)]
+
+    def store_and_stop(db, topic_id, posts):
+        # Stands in for the lifespan cancelling the scrape while later pages are still being fetched.
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(service.scraper, "fetch_topics", fetch_topics)
+    monkeypatch.setattr(service.scraper, "fetch_topic_posts", fetch_topic_posts)
+    monkeypatch.setattr(service, "_store_topic_posts", store_and_stop)
+
+    source = db_session.execute(select(Source)).scalar_one()
+    with pytest.raises(asyncio.CancelledError):
+        await service._sync_topics(db_session, source)
+
+    assert len(fetches) > 1
+    assert all(fetch.done() for fetch in fetches)
+
+
+@pytest.mark.asyncio
+async def test_geocode_topics_writes_results_in_one_update(db_session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    service = SyncService()
+    source = db_session.execute(select(Source)).scalar_one()
+    topics = [
+        Topic(source_id=source.id, external_id=f"g{i}", title=f"Topic {i}", url=f"https://example.com/t/g{i}", place_name=f"Place {i}")
+        for i in range(3)
+    ]
+    db_session.add_all(topics)
+    db_session.commit()
+    pending = [(topic.id, topic.place_name) for topic in topics]
+    # The sync loop only keeps topic ids; nothing is left in the identity map by now.
+    db_session.expunge_all()
+
+    async def geocode_many(place_names, db=None):
+        return [
+            GeocodeResult(lat=1.0, lon=2.0, confidence=0.8, provider="fake"),
+            None,
+            GeocodeResult(lat=3.0, lon=4.0, confidence=0.6, provider="fake"),
+        ]
+
+    monkeypatch.setattr(service.geocoding, "geocode_many", geocode_many)
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement.split(None, 1)[0])
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        await service._geocode_topics(db_session, pending)
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+    assert "SELECT" not in statements
+    stored = [db_session.get(Topic, topic_id) for topic_id, _ in pending]
+    assert [(t.geocoded_lat, t.geocode_provider) for t in stored] == [(1.0, "fake"), (None, None), (3.0, "fake")]
+
+
+def _service_with_transport(monkeypatch, tmp_path, handler) -> SyncService:
+    monkeypatch.chdir(tmp_path)
+    service = SyncService()
+
+    async def cookie(force_refresh=False, stale_cookie=None):
+        return "xf_session=1"
+
+    monkeypatch.setattr(service, "_ensure_forum_cookie", cookie)
+    monkeypatch.setattr(service.scraper.rate_limiter, "rate", 0)
+    service._attachment_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+@pytest.mark.asyncio
+async def test_attachment_downloads_take_scraper_rate_tokens(monkeypatch, tmp_path):
+    service = _service_with_transport(monkeypatch, tmp_path, lambda request: httpx.Response(200, content=b"img"))
+    acquired = []
+
+    async def acquire():
+        acquired.append(1)
+
+    monkeypatch.setattr(service.scraper.rate_limiter, "acquire", acquire)
+    results = await service._download_many([(f"https://example.com/{i}.jpg", tmp_path / f"{i}.jpg") for i in range(3)])
+
+    assert [r[1] for r in results] == [3, 3, 3]
+    assert len(acquired) == 3
+
+
+@pytest.mark.asyncio
+async def test_aclose_waits_for_a_running_sync(monkeypatch, tmp_path):
+    service = _service_with_transport(monkeypatch, tmp_path, lambda request: httpx.Response(200))
+    client = service._attachment_client
+
+    async with service._run_lock:
+        closing = asyncio.create_task(service.aclose())
+        await asyncio.sleep(0.01)
+        assert not closing.done() and not client.is_closed
+
+    await closing
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_rejected_relogin_pauses_attachment_downloads(monkeypatch, tmp_path):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url)
+        return httpx.Response(401)
+
+    service = _service_with_transport(monkeypatch, tmp_path, handler)
+
+    assert await service._download_attachment("https://example.com/a.jpg", tmp_path / "a.jpg") is None
+    assert len(requests) == 2  # the original attempt plus one after the forced re-login
+
+    assert await service._download_attachment("https://example.com/b.jpg", tmp_path / "b.jpg") is None
+    assert len(requests) == 2
+
+
+class _BrokenStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"partial"
+        raise httpx.ReadError("connection dropped")
+
+
+@pytest.mark.asyncio
+async def test_attachment_is_written_through_a_part_file(monkeypatch, tmp_path):
+    target = tmp_path / "media" / "a.jpg"
+    part = target.with_name("a.jpg.part")
+
+    broken = _service_with_transport(monkeypatch, tmp_path, lambda request: httpx.Response(200, stream=_BrokenStream()))
+    assert await broken._download_attachment("https://example.com/a.jpg", target) is None
+    assert not target.exists() and not part.exists()
+
+    service = _service_with_transport(monkeypatch, tmp_path, lambda request: httpx.Response(200, content=b"img"))
+    assert (await service._download_attachment("https://example.com/a.jpg", target))[1] == 3
+    assert target.read_bytes() == b"img"
+    assert not part.exists()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_of_one_post_download_once(db_session, monkeypatch, tmp_path):
+    service = _service_with_transport(monkeypatch, tmp_path, lambda request: httpx.Response(200))
+    post = db_session.get(Post, 1)
+    db_session.add(PostAttachment(post_id=post.id, source_url="https://example.com/a.jpg", file_name="a.jpg", is_image=True))
+    db_session.commit()
+    downloads = []
+
+    async def download(source_url, local_abs_path):
+        downloads.append(source_url)
+        await asyncio.sleep(0.01)
+        local_abs_path.parent.mkdir(parents=True, exist_ok=True)
+        local_abs_path.write_bytes(b"img")
+        return "image/jpeg", 3, source_url
+
+    monkeypatch.setattr(service, "_download_attachment", download)
+    results = await asyncio.gather(*(service.retry_post_attachments(db_session, post) for _ in range(3)))
+
+    assert downloads == ["https://example.com/a.jpg"]
+    assert sorted(results) == [(0, 1), (0, 1), (1, 1)]
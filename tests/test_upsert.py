@@ -0,0 +1,75 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import select
+
+from app.models import Post
+from app.services.forum_scraper import ScrapedAttachment, ScrapedPost, ScrapedTopic
+from app.services.repository import upsert_post_attachments, upsert_posts, upsert_topics
+
+
+def _scraped(external_id: str, content_text: str, attachments: list[ScrapedAttachment] | None = None) -> ScrapedPost:
+    return ScrapedPost(
+        topic_external_id="1",
+        external_id=external_id,
+        author="Ivan",
+        posted_at_utc=datetime(2026, 5, 1, tzinfo=UTC),
+        content_text=content_text,
+        url=f"https://example.com/p/{external_id}",
+        attachments=attachments or [],
+    )
+
+
+def test_upsert_posts_inserts_and_updates_in_batch(db_session):
+    ids = upsert_posts(db_session, 1, [_scraped("101", "Обновлено"), _scraped("102", "Новый пост")])
+    db_session.commit()
+    db_session.expire_all()
+
+    posts = {p.external_id: p for p in db_session.execute(select(Post).where(Post.topic_id == 1)).scalars()}
+    assert ids == {"101": posts["101"].id, "102": posts["102"].id}
+    assert posts["101"].content_text == "Обновлено"
+    assert posts["102"].content_text == "Новый пост"
+
+    updated_at = posts["102"].updated_at
+    assert upsert_posts(db_session, 1, [_scraped("102", "Новый пост")]) == {"102": posts["102"].id}
+    db_session.commit()
+    db_session.expire_all()
+    assert db_session.get(Post, ids["102"]).updated_at == updated_at
+
+
+def test_upsert_topics_updates_existing_and_inserts_new(db_session):
+    topics = upsert_topics(
+        db_session,
+        1,
+        [
+            ScrapedTopic(external_id="1", title="Пруд Рыбный (обновлено)", url="https://example.com/t/1", place_name="Пруд"),
+            ScrapedTopic(external_id="2", title="Озеро", url="https://example.com/t/2", place_name="Озеро"),
+        ],
+    )
+    db_session.commit()
+
+    assert set(topics) == {"1", "2"}
+    assert topics["1"].id == 1
+    assert topics["1"].title == "Пруд Рыбный (обновлено)"
+    assert topics["1"].geocoded_lat == 55.7
+    assert topics["2"].geocoded_lat is None
+
+
+def test_upsert_post_attachments_keeps_image_flag(db_session):
+    post = _scraped(
+        "101",
+        "Отличный клев",
+        [ScrapedAttachment("https://example.com/a.jpg", "a.jpg", True), ScrapedAttachment("https://example.com/b", "b", False)],
+    )
+    ids = upsert_posts(db_session, 1, [post])
+    first = upsert_post_attachments(db_session, ids, [post])
+    db_session.commit()
+
+    post.attachments = [ScrapedAttachment("https://example.com/a.jpg", "a-renamed.jpg", False)]
+    second = upsert_post_attachments(db_session, ids, [post])
+    db_session.commit()
+
+    assert set(first) == {(ids["101"], "https://example.com/a.jpg"), (ids["101"], "https://example.com/b")}
+    attachment = second[(ids["101"], "https://example.com/a.jpg")]
+    assert attachment.id == first[(ids["101"], "https://example.com/a.jpg")].id
+    assert attachment.file_name == "a-renamed.jpg"
+    assert attachment.is_image is True